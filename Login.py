@@ -1,5 +1,8 @@
 import streamlit as st
-import pyrebase
+
+import telemetry
+import warmup
+from auth_session import RETRY, AuthManager, load_or_create_secret
 
 # --------------------------------------------------------------------------------
 # 1. PAGE CONFIGURATION
@@ -16,6 +19,8 @@ st.set_page_config(
 @st.cache_resource
 def get_firebase():
     # Load config from Streamlit Secrets (Secure!)
+    import pyrebase  # ~0.3s import, only needed once per process
+
     try:
         firebaseConfig = dict(st.secrets["firebase"])
         # Change 1: Return the whole app, not just auth
@@ -27,12 +32,38 @@ def get_firebase():
 # Initialize the app
 firebase = get_firebase()
 
+@st.cache_resource
+def warm_up():
+    # Runs once per server process: preload app, model snapshot and animations in the background
+    return warmup.start_background_warm_up()
+
+warm_up()
+
+@st.cache_resource
+def metrics_server():
+    # One Prometheus /metrics endpoint per server process (HEART_METRICS_PORT)
+    return telemetry.start_metrics_server()
+
+metrics_server()
+
+@st.cache_resource
+def get_auth_manager(_firebase):
+    # Pooled auth calls, background token refresh and reload-proof sessions
+    try:
+        secret = st.secrets.get("auth", {}).get("session_secret") or load_or_create_secret()
+        return AuthManager(_firebase, secret).start()
+    except Exception as e:
+        print(f"Auth Error: {e}")
+        return None
+
 # Change 2: Extract BOTH Auth and Database tools
 if firebase:
-    auth = firebase.auth()
+    auth_manager = get_auth_manager(firebase)
+    # Plain pyrebase auth if the session manager could not start
+    auth = auth_manager or firebase.auth()
     db = firebase.database() # <--- NEW: Get the Database Tool
 else:
-    auth, db = None, None
+    auth_manager, auth, db = None, None, None
 
 # --------------------------------------------------------------------------------
 # 3. SESSION STATE MANAGEMENT
@@ -42,6 +73,44 @@ if 'user' not in st.session_state:
 if 'email' not in st.session_state:
     st.session_state.email = ''
 
+def sign_in(email, password):
+    if auth_manager:
+        return auth_manager.sign_in(email, password)
+    return auth.sign_in_with_email_and_password(email, password)
+
+def sign_up(email, password):
+    if auth_manager:
+        # Sign-up already returns tokens, so no second sign-in call is needed
+        return auth_manager.sign_up(email, password)
+    auth.create_user_with_email_and_password(email, password)
+    return auth.sign_in_with_email_and_password(email, password)
+
+def remember_session(user):
+    # The signed handle is a bearer credential: it lives in the server-side session state only
+    st.session_state.user = user
+    st.session_state.email = user.get('email', '')
+    st.session_state.session_handle = auth_manager.handle_for(user) if auth_manager else None
+
+def forget_session():
+    if auth_manager and st.session_state.user:
+        auth_manager.sign_out(st.session_state.user)
+    st.session_state.user = None
+    st.session_state.email = ''
+    st.session_state.session_handle = None
+
+# Links from older versions carried the handle in the URL; drop it
+if 'session' in st.experimental_get_query_params():
+    st.experimental_set_query_params()
+
+# Sessions end after AuthManager.max_age. restore() refreshes a nearly expired ID token over the
+# network; if that fails it returns RETRY and the doctor stays signed in.
+if st.session_state.user and st.session_state.get('session_handle'):
+    restored = auth_manager.restore(st.session_state.session_handle)
+    if restored is None:
+        forget_session()
+    elif restored is not RETRY:
+        st.session_state.user = restored
+
 # --------------------------------------------------------------------------------
 # 4. CUSTOM CSS STYLING
 # --------------------------------------------------------------------------------
@@ -79,12 +148,11 @@ def main():
         with st.sidebar:
             st.write(f"Logged in as: **{st.session_state.email}**")
             if st.button("Log out"):
-                st.session_state.user = None
-                st.session_state.email = ''
+                forget_session()
                 st.rerun() 
         
-        # Change 3: Pass the 'db' tool to the app
-        app.app_one(st.session_state.email, db)
+        # Change 3: Pass the 'db' tool (and the auth manager for its tokens) to the app
+        app.app_one(st.session_state.email, db, auth_manager)
 
     # --- SCENARIO B: USER IS NOT LOGGED IN ---
     else:
@@ -111,9 +179,8 @@ def main():
                     st.sidebar.error("Please enter both email and password")
                 else:
                     try:
-                        user = auth.sign_in_with_email_and_password(email, password)
-                        st.session_state.user = user
-                        st.session_state.email = email
+                        user = sign_in(email, password)
+                        remember_session(user)
                         st.success("Logged in successfully!")
                         st.rerun()
                     except Exception as e:
@@ -131,13 +198,11 @@ def main():
                     st.sidebar.error("Password must be at least 6 characters")
                 else:
                     try:
-                        user = auth.create_user_with_email_and_password(email, password)
+                        user = sign_up(email, password)
                         st.success('Account created! 🎉')
                         st.balloons()
                         
-                        user = auth.sign_in_with_email_and_password(email, password)
-                        st.session_state.user = user
-                        st.session_state.email = email
+                        remember_session(user)
                         st.rerun()
                     except Exception as e:
                         error_msg = str(e)
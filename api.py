@@ -0,0 +1,314 @@
+"""HTTP prediction API (plain ASGI, no framework).
+
+Endpoints:
+    GET  /health          -> {"status": "ok", "model_version": ...}
+    POST /predict         -> one record with the heart.csv field names
+    POST /predict/batch   -> a JSON array of records (or {"records": [...]})
+    POST /triage          -> risk band only, for one record or an array (risk_index lookup table)
+    POST /outcome         -> {"prediction_id": ..., "outcome": 0 or 1, "proba": optional}, back-fills a diagnosis
+    GET  /drift           -> input drift and calibration report (drift_monitor)
+
+/predict and /predict/batch results carry a `prediction_id` to report the
+outcome against later. Each worker process keeps its own drift monitor: it
+only sees its own traffic, and only the worker that made a prediction
+remembers its probability. Send the prediction's `risk_pct / 100` as `proba`
+with the outcome so any worker can record it.
+
+Concurrent /predict calls are micro-batched: requests arriving within
+`max_wait_ms` of each other are scored with one vectorized `predict_proba`.
+
+Run with keep-alive connections; workers share one read-only model in memory
+(shared_model.py):
+    uvicorn api:app --workers 4
+    python api.py --port 8000 --workers 4
+"""
+import asyncio
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from drift_monitor import DriftMonitor
+from heart_model import FEATURES, MODEL_PATH, model_fingerprint, risk_levels
+from risk_index import load_risk_index
+from shared_model import attach_or_load, export_shared
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_WAIT_MS = float(os.environ.get("HEART_API_MAX_WAIT_MS", 2))
+MAX_BATCH = int(os.environ.get("HEART_API_MAX_BATCH", 64))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# --------------------------------------------------------------------------------
+# 1. INPUT MAPPING
+# --------------------------------------------------------------------------------
+
+def record_to_row(record):
+    """heart.csv-named JSON object -> feature vector in model column order."""
+    if not isinstance(record, dict):
+        raise HTTPError(422, "Each record must be a JSON object")
+    missing = [f for f in FEATURES if f not in record]
+    if missing:
+        raise HTTPError(422, f"Missing fields: {', '.join(missing)}")
+    row = []
+    for f in FEATURES:
+        value = record[f]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise HTTPError(422, f"Field '{f}' must be a number")
+        row.append(float(value))
+    return row
+
+
+def _results(proba):
+    pct = np.round(proba * 100, 1)
+    return [
+        {"risk_pct": float(p), "risk_level": level}
+        for p, level in zip(pct, risk_levels(pct))
+    ]
+
+# --------------------------------------------------------------------------------
+# 2. MICRO-BATCHING
+# --------------------------------------------------------------------------------
+
+class AsyncBatcher:
+    """Collects single rows for up to `max_wait_ms` and scores them together."""
+
+    def __init__(self, predict_proba, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.predict_proba = predict_proba
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="predict")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def predict(self, row):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            rows = np.asarray([row for row, _ in batch])
+            try:
+                proba = await loop.run_in_executor(self._executor, self.predict_proba, rows)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), p in zip(batch, proba[:, 1]):
+                if not future.done():
+                    future.set_result(p)
+
+# --------------------------------------------------------------------------------
+# 3. ASGI APPLICATION
+# --------------------------------------------------------------------------------
+
+class PredictionAPI:
+    def __init__(self, model_path=MODEL_PATH):
+        self.model_path = model_path
+        self.model = None
+        self.model_version = None
+        self.batcher = None
+        self.risk_index = None
+        self.monitor = None
+
+    def load(self):
+        # Every worker maps the same read-only arrays instead of unpickling its own copy.
+        self.model = attach_or_load(self.model_path)
+        self.model_version = model_fingerprint(self.model_path)
+        try:
+            self.risk_index = load_risk_index(self.model_path)
+        except Exception as e:
+            # /triage still works without the table, just at model speed.
+            print(f"API Error: risk index unavailable ({e})")
+        self.monitor = DriftMonitor().register_metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self.load()
+                    self.batcher = AsyncBatcher(self.model.predict_proba)
+                    self.batcher.start()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.batcher:
+                    await self.batcher.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        try:
+            method, path = scope["method"], scope["path"].rstrip("/") or "/"
+            if path == "/health" and method == "GET":
+                payload = {"status": "ok", "model_version": self.model_version}
+            elif path == "/predict" and method == "POST":
+                payload = await self._predict(await self._json(receive))
+            elif path == "/predict/batch" and method == "POST":
+                payload = await self._predict_batch(await self._json(receive))
+            elif path == "/triage" and method == "POST":
+                payload = await self._triage(await self._json(receive))
+            elif path == "/outcome" and method == "POST":
+                payload = self._outcome(await self._json(receive))
+            elif path == "/drift" and method == "GET":
+                payload = self.monitor.report()
+            elif path in ("/health", "/predict", "/predict/batch", "/triage", "/outcome", "/drift"):
+                raise HTTPError(405, "Method not allowed")
+            else:
+                raise HTTPError(404, "Not found")
+            status = 200
+        except HTTPError as e:
+            status, payload = e.status, {"error": e.message}
+        except Exception as e:
+            print(f"API Error: {e}")
+            status, payload = 500, {"error": "Internal server error"}
+        await self._respond(send, status, payload)
+
+    async def _json(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        try:
+            return json.loads(b"".join(chunks))
+        except ValueError:
+            raise HTTPError(400, "Body must be valid JSON")
+
+    def _observe(self, rows, proba, results):
+        for row, p, result in zip(rows, proba, results):
+            result["prediction_id"] = uuid.uuid4().hex
+            self.monitor.observe(row, p, result["prediction_id"])
+        return results
+
+    async def _predict(self, record):
+        row = record_to_row(record)
+        proba = await self.batcher.predict(row)
+        result = self._observe([row], [proba], _results(np.asarray([proba])))[0]
+        result["model_version"] = self.model_version
+        return result
+
+    async def _predict_batch(self, body):
+        records = body.get("records") if isinstance(body, dict) else body
+        if not isinstance(records, list):
+            raise HTTPError(422, "Expected a JSON array of records")
+        if not records:
+            return {"model_version": self.model_version, "results": []}
+        rows = np.asarray([record_to_row(r) for r in records])
+        # Already a batch: score it directly instead of going through the batcher.
+        proba = await asyncio.get_running_loop().run_in_executor(None, self.model.predict_proba, rows)
+        results = self._observe(rows, proba[:, 1], _results(proba[:, 1]))
+        return {"model_version": self.model_version, "results": results}
+
+    def _outcome(self, body):
+        if not isinstance(body, dict) or "prediction_id" not in body or body.get("outcome") not in (0, 1):
+            raise HTTPError(422, "Expected {\"prediction_id\": ..., \"outcome\": 0 or 1}")
+        proba = body.get("proba")
+        if proba is not None and (isinstance(proba, bool) or not isinstance(proba, (int, float))
+                                  or not 0 <= proba <= 1):
+            raise HTTPError(422, "\"proba\" must be a number between 0 and 1")
+        if not self.monitor.record_outcome(body["prediction_id"], body["outcome"], proba):
+            raise HTTPError(404, "Unknown or expired prediction_id (send \"proba\" with the outcome)")
+        return {"status": "recorded"}
+
+    async def _triage(self, body):
+        if isinstance(body, dict) and "records" not in body:
+            row = record_to_row(body)
+            band = self.risk_index.band_one(row) if self.risk_index else None
+            if band is None:
+                band = risk_levels([await self.batcher.predict(row) * 100])[0]
+            return {"model_version": self.model_version, "risk_level": band}
+
+        records = body.get("records") if isinstance(body, dict) else body
+        if not isinstance(records, list):
+            raise HTTPError(422, "Expected a record or a JSON array of records")
+        if not records:
+            return {"model_version": self.model_version, "results": []}
+        rows = np.asarray([record_to_row(r) for r in records])
+        if self.risk_index:
+            bands = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.risk_index.risk_bands(rows, exact=True, model=self.model))
+        else:
+            proba = await asyncio.get_running_loop().run_in_executor(None, self.model.predict_proba, rows)
+            bands = risk_levels(proba[:, 1] * 100)
+        return {"model_version": self.model_version, "results": [{"risk_level": b} for b in bands]}
+
+    async def _respond(self, send, status, payload):
+        body = json.dumps(payload).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+app = PredictionAPI()
+
+
+def main(argv=None):
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the heart attack model over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    try:
+        export_shared()  # once, before the workers start and attach to it
+    except OSError as e:
+        print(f"API Error: shared model unavailable ({e})")
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers,
+                log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
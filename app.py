@@ -1,82 +1,472 @@
 import streamlit as st
 import numpy as np
-import requests
-import pickle
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from streamlit_option_menu import option_menu 
 from streamlit_lottie import st_lottie   
 
+from assets import HEART_LOTTIE_URL, load_lottie
+from batching import BatchScheduler
+from email_queue import EmailOutbox
+from firebase_writer import RecordWriter
+from history_store import HistoryStore
+from heart_model import FEATURES, form_to_features, read_model, risk_level
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+from telemetry import REGISTRY, span, traced
+
 # --------------------------------------------------------------------------------
 # 1. CACHED FUNCTIONS
 # --------------------------------------------------------------------------------
 
 @st.cache_resource
-def load_model():
-    return pickle.load(open("Model_datasets/final_model.pickle", "rb"))
+def get_model_registry():
+    # Serves Model_datasets/models/LIVE (or final_model.pickle); a new version is loaded,
+    # warmed up and swapped in by a background watcher, so deploys need no restart
+    return ModelRegistry().start().register_metrics()
+
+def current_model_version():
+    return get_model_registry().live.version
+
+def load_fast_model(model_version=None):
+    # Same probabilities as the sklearn model, without its per-call overhead.
+    # The registry keeps the compiled ensemble of every version still in use.
+    return get_model_registry().model(model_version).model
+
+@st.cache_resource(max_entries=1)
+def load_roster_model(model_version=None):
+    # sklearn's vectorized predict_proba: about 4x faster than the compiled ensemble
+    # on roster-sized chunks (see benchmarks.py), as in batch_score.py
+    with span("load_model", model_version=model_version):
+        return read_model(get_model_registry().model(model_version).path)
+
+@st.cache_resource(max_entries=1)
+def get_explainer(model_version=None):
+    # Per-patient feature contributions straight from the compiled trees
+    from explain import PathExplainer
+    return PathExplainer(load_fast_model(model_version))
+
+@st.cache_resource
+def get_batch_scheduler():
+    # Concurrent sessions are scored together in one vectorized call. One scheduler for
+    # all versions: each row is scored by the version its session resolved, so a hot swap
+    # needs no new scheduler thread (the registry also feeds the shadow comparison)
+    return BatchScheduler(get_model_registry().predict_proba, max_batch=32, max_wait_ms=2).start()
+
+@st.cache_resource
+def get_prediction_cache():
+    # Shared by all sessions; emptied automatically when the model version changes
+    cache = PredictionCache(maxsize=10_000, ttl=3600)
+    REGISTRY.gauge("heart_prediction_cache_hits", lambda: cache.hits)
+    REGISTRY.gauge("heart_prediction_cache_misses", lambda: cache.misses)
+    REGISTRY.gauge("heart_prediction_cache_size", lambda: cache.stats()["size"])
+    return cache
 
-@st.cache_data
 def load_lottieurl(url):
+    # Memory / disk cache / bundled fallback only; downloads happen in the background
+    with span("load_lottie"):
+        return load_lottie(url)
+
+@st.cache_resource
+def get_email_outbox():
+    # One background sender per server process, shared by all sessions
     try:
-        r = requests.get(url)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except:
+        gmail_user = st.secrets["email"]["gmail_user"]
+        gmail_password = st.secrets["email"]["gmail_password"]
+    except Exception as e:
+        print(f"Email Error: {e}")
+        return None
+    outbox = EmailOutbox(username=gmail_user, password=gmail_password).start()
+    REGISTRY.gauge("heart_email_outbox_queued", lambda: outbox.stats()["queued"])
+    return outbox
+
+@st.cache_resource
+def get_record_writer(database_url, _db, _auth=None):
+    # Write-behind queue in front of the realtime DB (flushed by a background thread).
+    # Each record is written with the ID token of the session that saved it (see record_owner).
+    # Keyed by the database URL: arguments starting with "_" are not part of the cache key.
+    token = _auth.token if _auth is not None else None
+    writer = RecordWriter(_db, "Patients_Analysis", max_batch=500, token=token).start()
+    REGISTRY.gauge("heart_db_pending_records", writer.pending)
+    return writer
+
+def record_writer(db, auth=None):
+    return get_record_writer(getattr(db, "database_url", None), db, auth)
+
+def record_owner():
+    # Session id of the signed-in doctor (set by auth_session.AuthManager)
+    return (st.session_state.get("user") or {}).get("sid")
+
+@st.cache_resource
+def get_cohort_tracker(_db=None):
+    # Insight tab aggregates: loaded from disk, then only newer Firebase records are fetched.
+    # A failed catch-up raises, so nothing is cached and the next rerun tries again.
+    from cohort_stats import CohortTracker
+    tracker = CohortTracker()
+    if _db is not None:
+        with span("cohort_catch_up"):
+            tracker.catch_up(_db)
+    return tracker
+
+def cohort_tracker(db):
+    # None until catch-up succeeds: observing newer records first would skip the unfetched ones
+    try:
+        return get_cohort_tracker(db)
+    except Exception as e:
+        print(f"Cohort Stats Error: {e}")
         return None
 
+@st.cache_resource
+def get_drift_monitor():
+    # Live inputs vs. heart.csv; alerts are printed and counted in heart_drift_alerts_total
+    from drift_monitor import DriftMonitor
+    return DriftMonitor().register_metrics()
+
+@st.cache_resource
+def get_history_store():
+    # Local Parquet history of every scored patient (written in the background)
+    return HistoryStore().start()
+
 # --------------------------------------------------------------------------------
 # 2. HELPER FUNCTIONS
 # --------------------------------------------------------------------------------
 
-def send_email_report(user_email, result_text):
-    try:
-        gmail_user = st.secrets["email"]["gmail_user"] 
-        gmail_password = st.secrets["email"]["gmail_password"]
+def build_report_message(sender, user_email, result_text, report=None):
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
 
-        msg = MIMEMultipart()
-        msg['From'] = f"Heart Attack App <{gmail_user}>"
-        msg['To'] = user_email
-        msg['Subject'] = "❤️ Your Heart Attack Risk Prediction Result"
+    msg = MIMEMultipart()
+    msg['From'] = f"Heart Attack App <{sender}>"
+    msg['To'] = user_email
+    msg['Subject'] = "❤️ Your Heart Attack Risk Prediction Result"
 
-        body = f"""
-        Hello,
+    body = f"""
+    Hello,
 
-        Thank you for using the Heart Attack Prediction App!
+    Thank you for using the Heart Attack Prediction App!
 
-        Your prediction result:
-        {result_text}
+    Your prediction result:
+    {result_text}
 
-        DISCLAIMER: This is an AI-powered tool for informational purposes only. 
-        It is not a substitute for professional medical advice.
+    DISCLAIMER: This is an AI-powered tool for informational purposes only. 
+    It is not a substitute for professional medical advice.
 
-        Stay healthy!
-        
-        —
-        Heart Attack Prediction App
-        """
-        msg.attach(MIMEText(body, 'plain'))
-
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.send_message(msg)
-        server.quit()
-        return True
+    Stay healthy!
+    
+    —
+    Heart Attack Prediction App
+    """
+    if report is not None:
+        # Formatted HTML report (vitals, risk, glossary) with this text as the plain-text part
+        from reports import build_message
+        return build_message(sender, user_email, report, text=body, subject=msg['Subject'])
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+@traced("send_roster_reports")
+def send_roster_reports(email, scored, model_version=None, to_patients=False):
+    """Queue one HTML report per scored roster row; returns how many were queued (None on error).
+
+    Reports go to the doctor. With `to_patients`, rows with a valid address in
+    the roster's email column go to the patient instead.
+    """
+    import os
+
+    from explain import top_drivers
+    from reports import build_messages, patient_report, recipient_address
+
+    try:
+        outbox = get_email_outbox()
+        if outbox is None:
+            return None
+        rows = scored[scored["risk_level"] != "invalid"]
+        if rows.empty:
+            return 0
+        name_col = roster_name_column(rows)
+        email_col = patient_email_column(rows) if to_patients else None
+        X = rows[FEATURES].to_numpy(float)
+        _, contributions = get_explainer(model_version).contributions(X)
+        reports, recipients = [], []
+        for i, (row, x, c) in enumerate(zip(rows.to_dict("records"), X, contributions)):
+            name = str(row[name_col]) if name_col else f"Roster row {i + 1}"
+            reports.append(patient_report(name, x, row["risk_pct"], drivers=top_drivers(c), doctor=email,
+                                          model_version=model_version))
+            recipients.append((recipient_address(row[email_col]) if email_col else None) or email)
+        messages = build_messages(outbox.username, recipients, reports, workers=os.cpu_count() or 1)
+        return len(outbox.enqueue_many(messages))
     except Exception as e:
         print(f"Email Error: {e}")
-        return False
+        return None
+
+@traced("send_email_report")
+def send_email_report(user_email, result_text, report=None):
+    """Queue the report for background delivery; returns the outbox id or None."""
+    try:
+        outbox = get_email_outbox()
+        if outbox is None:
+            return None
+        msg = build_report_message(outbox.username, user_email, result_text, report)
+        return outbox.enqueue(msg)
+    except Exception as e:
+        print(f"Email Error: {e}")
+        return None
+
+def show_email_status():
+    message_id = st.session_state.get("last_report_id")
+    outbox = get_email_outbox()
+    if message_id is None or outbox is None:
+        return
+    status = outbox.status(message_id)
+    if status is None:
+        return
+    if status["status"] == "sent":
+        st.caption("📧 Last report: delivered")
+    elif status["status"] == "failed":
+        st.caption(f"📧 Last report: could not be sent ({status['error']})")
+    elif status["attempts"]:
+        st.caption(f"📧 Last report: retrying (attempt {status['attempts'] + 1})")
+    else:
+        st.caption("📧 Last report: queued for delivery")
+
+def show_sensitivity(model, user_input, columns=3):
+    """Risk curves for each feature around the current patient, drawn as each sweep finishes."""
+    import pandas as pd
+    from sensitivity import CATEGORY_LABELS, FEATURE_TITLES, iter_sensitivity, value_labels
+
+    current = dict(zip(FEATURES, user_input))
+    cells = [col.empty() for _ in range(0, len(FEATURES), columns) for col in st.columns(columns)]
+    with span("sensitivity"):
+        for cell, (name, values, risk) in zip(cells, iter_sensitivity(model, user_input)):
+            with cell.container():
+                st.caption(f"**{FEATURE_TITLES[name]}** (now: {value_labels(name, [current[name]])[0]})")
+                chart = pd.DataFrame({"Risk %": risk}, index=value_labels(name, values))
+                if name in CATEGORY_LABELS:
+                    st.bar_chart(chart, height=160)
+                else:
+                    st.line_chart(chart, height=160)
+
+def show_top_drivers(explainer, user_input, k=3):
+    """The features that pushed this prediction up or down the most."""
+    from explain import top_drivers
+    from sensitivity import FEATURE_TITLES, value_labels
+
+    _, contributions = explainer.contributions([user_input])
+    current = dict(zip(FEATURES, user_input))
+    st.markdown("**Top drivers of this prediction**")
+    drivers = top_drivers(contributions[0], k)
+    for name, value in drivers:
+        label = value_labels(name, [current[name]])[0]
+        if value > 0:
+            st.markdown(f"🔺 {FEATURE_TITLES[name]}: **{label}** raises risk (odds ×{np.exp(value):.1f})")
+        else:
+            st.markdown(f"🔻 {FEATURE_TITLES[name]}: **{label}** lowers risk (odds ÷{np.exp(-value):.1f})")
+    return drivers
+
+def show_cohort_stats(stats):
+    """Live cohort dashboard from the incrementally maintained aggregates."""
+    import pandas as pd
+
+    st.subheader("Cohort Overview")
+    if not stats.total:
+        st.info("No predictions recorded yet. Statistics appear here as patients are analyzed.")
+        return
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Predictions", f"{stats.total:,}")
+    m2.metric("Patients (approx.)", f"{stats.patients.count():,}")
+    m3.metric("Doctors", f"{len(stats.doctors):,}")
+    m4.metric("Median risk", f"{stats.quantiles['risk_pct'].quantile(0.5):.1f}%")
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.caption("**Risk bands**")
+        bands = pd.DataFrame({"Patients": [stats.bands.get(b, 0) for b in ("low", "moderate", "high")]},
+                             index=["Low", "Moderate", "High"])
+        st.bar_chart(bands, height=220)
+    with c2:
+        st.caption("**Predictions per doctor (top 10)**")
+        top = stats.doctors.most_common(10)
+        st.bar_chart(pd.DataFrame({"Predictions": [n for _, n in top]}, index=[d for d, _ in top]), height=220)
+
+    titles = {"age": "Age", "chol": "Cholesterol (mg/dl)", "trtbps": "Resting Blood Pressure (mm Hg)"}
+    for col, (name, title) in zip(st.columns(3), titles.items()):
+        with col:
+            st.caption(f"**{title}**")
+            bins = stats.histogram(name)
+            st.bar_chart(pd.DataFrame({"Patients": [c for _, c in bins]}, index=[b for b, _ in bins]), height=200)
+
+    quantiles = {
+        title: [stats.quantiles[name].quantile(q) for q in (0.1, 0.5, 0.9)]
+        for name, title in [("risk_pct", "Risk %"), ("age", "Age"), ("chol", "Cholesterol"), ("trtbps", "Blood Pressure")]
+    }
+    st.dataframe(pd.DataFrame(quantiles, index=["10th percentile", "Median", "90th percentile"]).round(1),
+                 use_container_width=True)
+
+def show_drift_report(report):
+    """How recent inputs compare with the heart.csv training data."""
+    import pandas as pd
+    from sensitivity import FEATURE_TITLES
+
+    with st.expander(f"Input drift vs. training data (last {report['window']:,} patients)"):
+        if not report["window"]:
+            st.caption("No patients analyzed since the app started.")
+            return
+        for alert in report["alerts"]:
+            if alert["kind"] == "feature_drift":
+                st.warning(f"⚠️ **{FEATURE_TITLES[alert['feature']]}** differs from the training data "
+                           f"(PSI {alert['psi']:.2f}, KS {alert['ks']:.2f}).")
+            else:
+                st.warning(f"⚠️ Predicted risks are poorly calibrated against recorded outcomes (ECE {alert['ece']:.2f}).")
+        drift = pd.DataFrame(report["features"]).T.rename(index=FEATURE_TITLES, columns={"psi": "PSI", "ks": "KS"})
+        st.dataframe(drift.sort_values("PSI", ascending=False).round(3), use_container_width=True)
+        st.caption("PSI above 0.2 or KS above 0.2 means the feature's recent values no longer look like the training data.")
+        calibration = report["calibration"]
+        if calibration["count"]:
+            st.caption(f"Calibration over {calibration['count']:,} recorded outcomes: "
+                       f"ECE {calibration['ece']:.3f}, Brier score {calibration['brier']:.3f}")
+
+def read_roster(uploaded):
+    import pandas as pd
+
+    if uploaded.name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(uploaded)
+    return pd.read_csv(uploaded)
+
+def roster_name_column(frame):
+    return next((c for c in ("Patient_Name", "name", "Name") if c in frame.columns), None)
+
+def patient_email_column(frame):
+    return next((c for c in ("Patient_Email", "email", "Email") if c in frame.columns), None)
+
+def roster_records(scored, email):
+    name_col = roster_name_column(scored)
+    timestamp = str(np.datetime64('now'))
+    records = []
+    for i, row in enumerate(scored.to_dict("records")):
+        if row["risk_level"] == "invalid":
+            continue
+        records.append({
+            "Patient_Name": str(row[name_col]) if name_col else f"Roster row {i + 1}",
+            "Age": int(row["age"]),
+            "Sex": "Male" if int(row["sex"]) == 1 else "Female",
+            "BloodPressure": int(row["trtbps"]),
+            "Cholesterol": int(row["chol"]),
+            "HeartRate": int(row["thalachh"]),
+            "Prediction": f"{row['risk_pct']:.1f}% ({row['risk_level'].capitalize()} Risk)",
+            "Doctor_Email": email,
+            "Timestamp": timestamp,
+        })
+    return records
+
+def bulk_upload_section(email=None, db=None, auth=None):
+    import hashlib
+    import pandas as pd
+    from batch_score import score_frame
+    from heart_model import feature_matrix
+
+    st.subheader("Bulk Patient Upload")
+    st.caption(
+        f"Upload a CSV or Excel file with the columns {', '.join(FEATURES)}; "
+        "rows with a missing value or a value outside the form's ranges are not scored. "
+        "An optional Patient_Name column is kept in the results; with a Patient_Email column, "
+        "emailed reports go to each patient instead of you."
+    )
+    uploaded = st.file_uploader("Patient roster", type=["csv", "xlsx", "xls"])
+    if uploaded is None:
+        return
+
+    digest = hashlib.sha256(uploaded.getvalue()).hexdigest()
+    result = st.session_state.get("bulk_result")
+
+    if result is None or result[0] != digest:
+        try:
+            roster = read_roster(uploaded)
+            _, valid = feature_matrix(roster, check_ranges=True)
+        except ImportError:
+            package = "xlrd" if uploaded.name.lower().endswith(".xls") else "openpyxl"
+            st.error(f"Excel support needs the '{package}' package. Please upload a CSV instead.")
+            return
+        except Exception as e:
+            st.error(f"Invalid roster file: {e}")
+            return
+
+        st.info(f"{len(roster):,} patients found in {uploaded.name}.")
+        if not valid.all():
+            st.warning(f"{int((~valid).sum()):,} rows have missing or out-of-range values and will not be scored.")
+        if not st.button("Score Roster", type="primary"):
+            return
+
+        model_version = current_model_version()
+        model = load_roster_model(model_version)
+        explainer = get_explainer(model_version)
+        chunk_size = 10_000
+        progress = st.progress(0.0, text="Scoring patients...")
+        scored_chunks = []
+        for start in range(0, len(roster), chunk_size):
+            scored_chunks.append(score_frame(model, roster.iloc[start:start + chunk_size], explainer,
+                                             check_ranges=True))
+            done = min(start + chunk_size, len(roster))
+            progress.progress(done / len(roster), text=f"Scored {done:,} of {len(roster):,} patients")
+        progress.empty()
+        scored = pd.concat(scored_chunks, ignore_index=True)
+        st.session_state.bulk_result = (digest, scored)
+
+        history_rows = scored[scored["risk_level"] != "invalid"]
+        name_col = roster_name_column(history_rows)
+        get_history_store().append([
+            dict({f: row[f] for f in FEATURES}, doctor_email=email, model_version=model_version,
+                 patient_name=str(row[name_col]) if name_col else "", risk_pct=row["risk_pct"],
+                 risk_level=row["risk_level"])
+            for row in history_rows.to_dict("records")
+        ])
+
+        records = roster_records(scored, email)
+        keys = record_writer(db, auth).push_many(records, record_owner()) if db else [None] * len(records)
+        tracker, monitor = cohort_tracker(db), get_drift_monitor()
+        for key, record, row in zip(keys, records, history_rows[FEATURES + ["risk_pct"]].to_numpy(float)):
+            if tracker:
+                tracker.observe(key, record)
+            monitor.observe(row[:-1], row[-1] / 100, key)
+        if db:
+            st.toast(f"{len(records):,} records queued for saving 💾")
+    else:
+        scored = result[1]
+
+    bands = scored["risk_level"].value_counts()
+    b1, b2, b3, b4 = st.columns(4)
+    b1.metric("Low (<30%)", int(bands.get("low", 0)))
+    b2.metric("Moderate (<60%)", int(bands.get("moderate", 0)))
+    b3.metric("High", int(bands.get("high", 0)))
+    b4.metric("Invalid rows", int(bands.get("invalid", 0)))
+
+    st.dataframe(scored.sort_values("risk_pct", ascending=False), use_container_width=True, hide_index=True)
+    st.download_button(
+        "Download Results (CSV)",
+        scored.to_csv(index=False).encode("utf-8"),
+        file_name=f"scored_{uploaded.name.rsplit('.', 1)[0]}.csv",
+        mime="text/csv",
+    )
+    to_patients = False
+    if email and patient_email_column(scored):
+        to_patients = st.checkbox(
+            f"Send each report to the patient's address in the '{patient_email_column(scored)}' column",
+            help="Off: every report goes to you. Rows without a valid address always go to you.")
+    if email and st.button("📧 Email Reports"):
+        with st.spinner("Rendering reports..."):
+            queued = send_roster_reports(email, scored, current_model_version(), to_patients)
+        if queued is None:
+            st.error("Could not send email.")
+        else:
+            st.toast(f"{queued:,} reports queued for delivery", icon="📧")
 
 # --------------------------------------------------------------------------------
 # 3. MAIN APP FUNCTION
 # --------------------------------------------------------------------------------
 
-def app_one(email=None, db=None):
+def app_one(email=None, db=None, auth=None):
     
-    loaded_model = load_model()
-    anim_heart = load_lottieurl("https://assets5.lottiefiles.com/packages/lf20_zw7jo1.json")
-    anim_coding = load_lottieurl("https://assets1.lottiefiles.com/packages/lf20_ggxx4yii.json")
+    model_version = current_model_version()
+    scheduler = get_batch_scheduler()
+    prediction_cache = get_prediction_cache()
+    anim_heart = load_lottieurl(HEART_LOTTIE_URL)
 
     # --- MENU CONFIGURATION ---
     menu_styles = {
@@ -103,8 +493,13 @@ def app_one(email=None, db=None):
             if anim_heart:
                 st_lottie(anim_heart, height=130, key="heart_anim")
 
+        mode = st.radio("Mode", ["Single patient", "Bulk upload"], horizontal=True, label_visibility="collapsed")
         st.write("---")
 
+        if mode == "Bulk upload":
+            bulk_upload_section(email, db, auth)
+            return
+
         # --- FORM INPUTS ---
         
         st.subheader("1. Patient Identification")
@@ -209,42 +604,12 @@ def app_one(email=None, db=None):
                 help="Result of the Thallium stress test. 'Fixed' means permanent damage (scar), 'Reversible' means reduced blood flow."
             )
 
-        # --- MAPPING INPUTS ---
-        
-        sex_map = {"Male": 1, "Female": 0}
-        fbs_map = {'No (Normal)': 0, 'Yes (High)': 1}
-        exang_map = {"No": 0, "Yes": 1}
-        
-        cp_map = {
-            "Typical Angina (Pressure/Squeeze)": 0, 
-            "Atypical Angina (Sharp/Stabbing)": 1, 
-            "Non-anginal Pain (Not Heart Related)": 2, 
-            "Asymptomatic (No Pain)": 3
-        }
-        
-        restecg_map = {
-            "Normal": 0, 
-            "ST-T Wave Abnormality (Irregular)": 1, 
-            "Left Ventricular Hypertrophy (Thickened Heart)": 2
-        }
-        
-        slope_map = {
-            "Upsloping (Healthy/Normal)": 0, 
-            "Flatsloping (Minimal Change)": 1, 
-            "Downsloping (Unhealthy Sign)": 2
-        }
-        
-        thal_map = {
-            "Normal": 2, 
-            "Fixed Defect (Past Heart Issue)": 1, 
-            "Reversible Defect (Current Issue)": 3
-        }
-
         # --- PREDICTION BUTTON ---
         st.write("---")
         center_c1, center_c2, center_c3 = st.columns([1,2,1])
         with center_c2:
             predict_btn = st.button("Analyze Risk", type="primary", use_container_width=True)
+            show_email_status()
 
         if predict_btn:
             try:
@@ -252,24 +617,28 @@ def app_one(email=None, db=None):
                     st.warning("Please enter the patient's name before analyzing.")
                     st.stop()
 
-                user_input = [
-                    age, sex_map[sex], cp_map[cp_choice], trestbps, chol,
-                    fbs_map[fbs_choice], restecg_map[restecg_choice], thalach,
-                    exang_map[exang_choice], oldpeak, slope_map[slope_choice],
-                    int(ca_choice), thal_map[thal_choice]
-                ]
-
-                input_reshaped = np.asarray(user_input).reshape(1, -1)
-
-                proba_disease = loaded_model.predict_proba(input_reshaped)[0][1] * 100
-
-                st.metric(
-                    label="Estimated Heart Disease Risk",
-                    value=f"{proba_disease:.1f}%",
-                    delta=None,
-                    delta_color="inverse"
+                user_input = form_to_features(
+                    age, sex, cp_choice, trestbps, chol, fbs_choice, restecg_choice,
+                    thalach, exang_choice, oldpeak, slope_choice, ca_choice, thal_choice
                 )
 
+                with span("predict", model_version=model_version):
+                    proba_disease = prediction_cache.get_or_compute(
+                        user_input, model_version,
+                        lambda: scheduler.predict(user_input, version=model_version)
+                    ) * 100
+
+                metric_col, drivers_col = st.columns([1, 2])
+                with metric_col:
+                    st.metric(
+                        label="Estimated Heart Disease Risk",
+                        value=f"{proba_disease:.1f}%",
+                        delta=None,
+                        delta_color="inverse"
+                    )
+                with drivers_col:
+                    drivers = show_top_drivers(get_explainer(model_version), user_input)
+
                 if proba_disease < 30:
                     st.success(f"✅ **Low estimated risk** for {patient_name} ({proba_disease:.1f}%)")
                     if proba_disease < 20:
@@ -279,8 +648,12 @@ def app_one(email=None, db=None):
                 else:
                     st.error(f"🚨 **High estimated risk** for {patient_name} ({proba_disease:.1f}%) – please consult a doctor immediately!")
 
-                risk_level = "low" if proba_disease < 30 else "moderate" if proba_disease < 60 else "high"
-                result_msg = f"Report for {patient_name}: Estimated heart disease risk is {proba_disease:.1f}% ({risk_level})."
+                level = risk_level(proba_disease)
+                get_history_store().append([dict(
+                    zip(FEATURES, user_input), doctor_email=email, patient_name=patient_name,
+                    model_version=model_version, risk_pct=proba_disease, risk_level=level,
+                )])
+                result_msg = f"Report for {patient_name}: Estimated heart disease risk is {proba_disease:.1f}% ({level})."
 
                 with st.expander("⚠️ Important information about this prediction", expanded=True):
                     st.markdown("""
@@ -293,28 +666,41 @@ def app_one(email=None, db=None):
                     Please consult a qualified physician for any health concerns.
                     """)
 
+                patient_record = {
+                    "Patient_Name": patient_name,
+                    "Age": age,
+                    "Sex": sex,
+                    "BloodPressure": trestbps,
+                    "Cholesterol": chol,
+                    "HeartRate": thalach,
+                    "Prediction": f"{proba_disease:.1f}% ({level.capitalize()} Risk)",
+                    "Doctor_Email": email,
+                    "Timestamp": str(np.datetime64('now'))
+                }
+                record_key = None
                 if db:
-                    patient_record = {
-                        "Patient_Name": patient_name,
-                        "Age": age,
-                        "Sex": sex,
-                        "BloodPressure": trestbps,
-                        "Cholesterol": chol,
-                        "HeartRate": thalach,
-                        "Prediction": f"{proba_disease:.1f}% ({risk_level.capitalize()} Risk)",
-                        "Doctor_Email": email,
-                        "Timestamp": str(np.datetime64('now'))
-                    }
-                    db.child("Patients_Analysis").push(patient_record)
+                    with span("db_push"):
+                        record_key = record_writer(db, auth).push(patient_record, record_owner())
                     st.toast(f"Record for {patient_name} Saved! 💾")
+                tracker = cohort_tracker(db)
+                if tracker:
+                    tracker.observe(record_key, patient_record)
+                get_drift_monitor().observe(user_input, proba_disease / 100, record_key)
 
                 if email:
-                    with st.spinner("Sending report to your email..."):
-                        sent = send_email_report(email, result_msg)
-                        if sent:
-                            st.toast("Email sent successfully!", icon="📧")
-                        else:
-                            st.error("Could not send email.")
+                    from reports import patient_report
+                    report = patient_report(patient_name, user_input, proba_disease, drivers=drivers,
+                                            doctor=email, model_version=model_version)
+                    report_id = send_email_report(email, result_msg, report)
+                    if report_id is not None:
+                        st.session_state.last_report_id = report_id
+                        st.toast("Report queued for your email", icon="📧")
+                    else:
+                        st.error("Could not send email.")
+
+                with st.expander("📈 What-if: how each factor moves this patient's risk", expanded=True):
+                    st.caption("Each chart changes one value and keeps the rest of the form as entered.")
+                    show_sensitivity(load_fast_model(model_version), user_input)
             
             except Exception as e:
                 st.error(f"An error occurred: {e}")
@@ -385,6 +771,13 @@ def app_one(email=None, db=None):
     # ==========================
     if selected == 'Insight':
         st.title("Heart Health Insights")
+        tracker = cohort_tracker(db)
+        if tracker:
+            show_cohort_stats(tracker.snapshot())
+        else:
+            st.warning("Cohort statistics are unavailable right now (could not reach the database).")
+        show_drift_report(get_drift_monitor().report())
+        st.write("---")
         try:
             st.image("Media/info1.jpg")
             st.write("---")
@@ -0,0 +1,134 @@
+"""Lottie animations served from disk, never from the network on the hot path.
+
+Lookup order for `load_lottie(url)`:
+    1. process memory
+    2. the on-disk cache (.cache/lottie), content-addressed by sha256
+    3. a bundled fallback in Media/lottie/ (same file name as the URL)
+
+A miss in the disk cache schedules a background download (with a hard
+timeout) and returns whatever is available right now; `prefetch()` warms
+the cache for all known animations when the server starts.
+"""
+import hashlib
+import json
+import os
+import threading
+
+LOTTIE_CACHE_DIR = ".cache/lottie"
+BUNDLED_LOTTIE_DIR = "Media/lottie"
+
+HEART_LOTTIE_URL = "https://assets5.lottiefiles.com/packages/lf20_zw7jo1.json"
+LOTTIE_URLS = [HEART_LOTTIE_URL]
+
+# (connect, read) seconds; a dead network must not hang the fetch thread either.
+FETCH_TIMEOUT = (3.05, 5)
+
+_memory = {}
+_in_flight = set()
+_lock = threading.Lock()
+
+
+def _index_path():
+    return os.path.join(LOTTIE_CACHE_DIR, "index.json")
+
+
+def _read_index():
+    try:
+        with open(_index_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_cached(url):
+    digest = _read_index().get(url)
+    if not digest:
+        return None
+    try:
+        with open(os.path.join(LOTTIE_CACHE_DIR, f"{digest}.json"), "rb") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if hashlib.sha256(raw).hexdigest() != digest:
+        return None  # truncated or corrupted file; refetch
+    return json.loads(raw)
+
+
+def _read_bundled(url):
+    path = os.path.join(BUNDLED_LOTTIE_DIR, os.path.basename(url))
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_lottie(url, timeout=FETCH_TIMEOUT):
+    """Download `url` into the disk cache; returns the parsed JSON or None."""
+    import requests
+
+    try:
+        r = requests.get(url, timeout=timeout)
+        if r.status_code != 200:
+            return None
+        raw = r.content
+        data = json.loads(raw)
+    except Exception as e:
+        print(f"Lottie Error ({url}): {e}")
+        return None
+
+    digest = hashlib.sha256(raw).hexdigest()
+    with _lock:
+        os.makedirs(LOTTIE_CACHE_DIR, exist_ok=True)
+        _write_atomic(os.path.join(LOTTIE_CACHE_DIR, f"{digest}.json"), raw)
+        index = _read_index()
+        index[url] = digest
+        _write_atomic(_index_path(), json.dumps(index).encode())
+        _memory[url] = data
+    return data
+
+
+def _fetch_in_background(url):
+    with _lock:
+        if url in _in_flight:
+            return
+        _in_flight.add(url)
+
+    def run():
+        try:
+            fetch_lottie(url)
+        finally:
+            with _lock:
+                _in_flight.discard(url)
+
+    threading.Thread(target=run, name="lottie-fetch", daemon=True).start()
+
+
+def load_lottie(url):
+    """Return the animation JSON without touching the network (None if unknown)."""
+    data = _memory.get(url)
+    if data is not None:
+        return data
+
+    data = _read_cached(url)
+    if data is None:
+        _fetch_in_background(url)
+        data = _read_bundled(url)
+    if data is not None:
+        with _lock:
+            _memory.setdefault(url, data)
+    return data
+
+
+def prefetch(urls=LOTTIE_URLS):
+    """Start background downloads for animations missing from the disk cache."""
+    for url in urls:
+        if _read_cached(url) is None:
+            _fetch_in_background(url)
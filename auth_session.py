@@ -0,0 +1,302 @@
+"""Firebase auth sessions: pooled HTTP, background token refresh, restorable logins.
+
+pyrebase's `Auth` sends every request with a module-level `requests.post`
+(a new TLS connection each time) and never refreshes the one-hour ID token.
+`AuthManager` talks to the same Identity Toolkit endpoints through the
+pyrebase app's `requests.Session` (so auth and realtime DB traffic share one
+connection pool), keeps every signed-in `user` dict fresh from a background
+thread, and hands out a signed session handle:
+
+    manager = AuthManager(firebase, secret)
+    user = manager.sign_in(email, password)      # same dict as pyrebase returns
+    handle = manager.handle_for(user)            # keep in st.session_state, never in the URL
+    user = manager.restore(handle)               # on each rerun; None once expired or signed out,
+                                                 # RETRY if the token could not be refreshed just now
+
+Refresh tokens are kept server-side in a local SQLite store and the handle is
+only an HMAC-signed random session id. Sessions end `max_age` seconds after
+sign-in: they are then dropped from memory and the store instead of being
+refreshed. A refresh that fails on the network does not end a session: the
+user is kept while the ID token is still valid, and the refresh is retried.
+"""
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from telemetry import span
+
+DEFAULT_STORE_PATH = ".cache/auth_sessions.sqlite3"
+DEFAULT_SECRET_PATH = ".cache/auth_secret"
+
+IDENTITY_URL = "https://www.googleapis.com/identitytoolkit/v3/relyingparty/{0}?key={1}"
+TOKEN_URL = "https://securetoken.googleapis.com/v1/token?key={0}"
+HEADERS = {"content-type": "application/json; charset=UTF-8"}
+RETRY_AFTER = 30
+
+# restore() result: the session is fine, but its ID token could not be refreshed right now
+RETRY = "retry"
+
+
+def load_or_create_secret(path=DEFAULT_SECRET_PATH):
+    """Signing key for session handles, generated once per deployment."""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    key = secrets.token_bytes(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _raise_for_status(response):
+    # Same error text as pyrebase, so callers can keep matching "EMAIL_EXISTS" etc.
+    from requests.exceptions import HTTPError
+
+    try:
+        response.raise_for_status()
+    except HTTPError as e:
+        raise HTTPError(e, response.text, response=response)
+
+
+def _is_rejection(error):
+    """True when Firebase refused the refresh token (revoked, user disabled), not a network or server error."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500
+
+
+class AuthManager:
+    def __init__(self, firebase, secret, store_path=DEFAULT_STORE_PATH, session=None,
+                 refresh_margin=300, max_age=12 * 3600, pool_size=20):
+        import requests
+
+        self.api_key = firebase.api_key if hasattr(firebase, "api_key") else firebase
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.refresh_margin = refresh_margin
+        self.max_age = max_age
+
+        self.session = session or getattr(firebase, "requests", None) or requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=3)
+        for scheme in ("http://", "https://"):
+            self.session.mount(scheme, adapter)
+
+        if os.path.dirname(store_path):
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        self._store = sqlite3.connect(store_path, check_same_thread=False)
+        self._store.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, email TEXT, local_id TEXT, refresh_token TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._store.commit()
+        os.chmod(store_path, 0o600)
+
+        self._lock = threading.Lock()
+        self._users = {}      # sid -> live user dict (shared with st.session_state)
+        self._retry_at = {}   # sid -> earliest next refresh attempt after a failure
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------------------------------------------
+    # Identity Toolkit calls (pooled)
+    # ----------------------------------------------------------------------------
+
+    def _post(self, url, payload):
+        response = self.session.post(url, headers=HEADERS, data=json.dumps(payload))
+        _raise_for_status(response)
+        return response.json()
+
+    def _identity(self, method, payload):
+        return self._post(IDENTITY_URL.format(method, self.api_key), payload)
+
+    def sign_in(self, email, password):
+        with span("auth_sign_in"):
+            user = self._identity("verifyPassword", {"email": email, "password": password, "returnSecureToken": True})
+        return self._open_session(user)
+
+    def sign_up(self, email, password):
+        with span("auth_sign_up"):
+            user = self._identity("signupNewUser", {"email": email, "password": password, "returnSecureToken": True})
+        return self._open_session(user)
+
+    def send_password_reset_email(self, email):
+        with span("auth_password_reset"):
+            return self._identity("getOobConfirmationCode", {"requestType": "PASSWORD_RESET", "email": email})
+
+    def _refresh_token(self, refresh_token):
+        with span("auth_refresh"):
+            data = self._post(TOKEN_URL.format(self.api_key),
+                              {"grantType": "refresh_token", "refreshToken": refresh_token})
+        return {
+            "idToken": data["id_token"],
+            "refreshToken": data["refresh_token"],
+            "localId": data["user_id"],
+            "expiresAt": time.time() + int(data.get("expires_in", 3600)),
+        }
+
+    # ----------------------------------------------------------------------------
+    # Sessions
+    # ----------------------------------------------------------------------------
+
+    def _open_session(self, user):
+        sid = secrets.token_urlsafe(24)
+        now = time.time()
+        user["sid"] = sid
+        user["sessionCreated"] = now
+        user["expiresAt"] = now + int(user.get("expiresIn", 3600))
+        with self._lock:
+            self._users[sid] = user
+            self._store.execute(
+                "INSERT INTO sessions (sid, email, local_id, refresh_token, created) VALUES (?, ?, ?, ?, ?)",
+                (sid, user.get("email"), user.get("localId"), user["refreshToken"], now),
+            )
+            self._store.commit()
+        self._wakeup.set()
+        return user
+
+    def _sign(self, sid):
+        return hmac.new(self.secret, sid.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _expired(self, user, now=None):
+        return (now or time.time()) - user.get("sessionCreated", 0) > self.max_age
+
+    def handle_for(self, user):
+        """Signed, opaque session handle; a bearer credential, so keep it server-side (st.session_state)."""
+        return f"{user['sid']}.{self._sign(user['sid'])}"
+
+    def restore(self, handle):
+        """The signed-in user for `handle`, refreshing its ID token if needed.
+
+        None if the handle is invalid or the session has ended; RETRY if the
+        token needs a refresh that failed on the network (the session stays).
+        """
+        sid, _, signature = (handle or "").partition(".")
+        if not sid or not hmac.compare_digest(signature, self._sign(sid)):
+            return None
+        with self._lock:
+            user = self._users.get(sid)
+            now = time.time()
+            if user is not None and not self._expired(user, now) and (
+                    user["expiresAt"] - now > self.refresh_margin
+                    or (user["expiresAt"] > now and self._retry_at.get(sid, 0) > now)):
+                return user  # still warm in this process (or waiting to retry a refresh): no network call
+            row = self._store.execute(
+                "SELECT email, local_id, refresh_token, created FROM sessions WHERE sid = ?", (sid,)
+            ).fetchone()
+        if row is None or time.time() - row[3] > self.max_age or (user is not None and self._expired(user)):
+            self.sign_out(sid)
+            return None
+        try:
+            fresh = self._refresh_token(row[2])
+        except Exception as e:
+            print(f"Auth Error: {e}")
+            if _is_rejection(e):
+                self.sign_out(sid)
+                return None
+            with self._lock:
+                self._retry_at[sid] = time.time() + RETRY_AFTER
+            return user if user is not None and user["expiresAt"] > time.time() else RETRY
+        user = user or {"email": row[0], "sid": sid, "sessionCreated": row[3]}
+        self._update(sid, user, fresh)
+        self._wakeup.set()
+        return user
+
+    def sign_out(self, user_or_sid):
+        sid = user_or_sid.get("sid") if isinstance(user_or_sid, dict) else user_or_sid
+        with self._lock:
+            self._users.pop(sid, None)
+            self._retry_at.pop(sid, None)
+            self._store.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            self._store.commit()
+
+    def token(self, user_or_sid):
+        """The current ID token of this signed-in session; None once it has expired or signed out."""
+        sid = user_or_sid.get("sid") if isinstance(user_or_sid, dict) else user_or_sid
+        with self._lock:
+            user = self._users.get(sid)
+        if user is None or user.get("expiresAt", 0) <= time.time() or self._expired(user):
+            return None
+        return user["idToken"]
+
+    def _update(self, sid, user, fresh):
+        # Update in place: st.session_state holds the same dict.
+        with self._lock:
+            user.update(fresh)
+            self._users[sid] = user
+            self._store.execute("UPDATE sessions SET refresh_token = ? WHERE sid = ?", (fresh["refreshToken"], sid))
+            self._store.commit()
+
+    # ----------------------------------------------------------------------------
+    # Background refresh
+    # ----------------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="auth-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def prune(self):
+        """End sessions older than `max_age` (in memory and in the store); returns how many were live."""
+        now = time.time()
+        with self._lock:
+            stale = [sid for sid, u in self._users.items() if self._expired(u, now)]
+            for sid in stale:
+                self._users.pop(sid, None)
+                self._retry_at.pop(sid, None)
+            self._store.execute("DELETE FROM sessions WHERE created < ?", (now - self.max_age,))
+            self._store.commit()
+        return len(stale)
+
+    def refresh_due(self):
+        """Refresh every live session expiring within `refresh_margin`; returns the count."""
+        self.prune()
+        now = time.time()
+        with self._lock:
+            due = [(sid, u) for sid, u in self._users.items()
+                   if u["expiresAt"] - now <= self.refresh_margin and self._retry_at.get(sid, 0) <= now]
+        for sid, user in due:
+            try:
+                self._update(sid, user, self._refresh_token(user["refreshToken"]))
+                self._retry_at.pop(sid, None)
+            except Exception as e:
+                print(f"Auth Error: {e}")
+                with self._lock:
+                    if user["expiresAt"] <= now:
+                        # Expired and still failing: forget it here; restore() can retry later.
+                        self._users.pop(sid, None)
+                        self._retry_at.pop(sid, None)
+                    else:
+                        self._retry_at[sid] = now + RETRY_AFTER
+        return len(due)
+
+    def _next_due(self):
+        with self._lock:
+            due = [min(max(u["expiresAt"] - self.refresh_margin, self._retry_at.get(sid, 0)),
+                       u.get("sessionCreated", 0) + self.max_age)
+                   for sid, u in self._users.items()]
+        if not due:
+            return 60.0
+        return max(min(due) - time.time(), 1.0)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self._next_due())
+            self._wakeup.clear()
+            if not self._stopping.is_set():
+                self.refresh_due()
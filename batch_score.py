@@ -0,0 +1,201 @@
+"""Headless batch scoring for patient exports in the heart.csv column layout.
+
+Examples:
+    python batch_score.py patients.csv -o scored.csv
+    python batch_score.py patients.parquet -o scored.parquet --workers 4
+
+The model is loaded once (once per worker when --workers > 1), the input is
+read in chunks and every chunk is scored with a single vectorized
+`predict_proba` call, so memory stays bounded by --chunksize * in-flight chunks.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from heart_model import FEATURES, MODEL_PATH, feature_matrix, read_model, risk_levels
+
+RISK_COLUMN = "risk_pct"
+LEVEL_COLUMN = "risk_level"
+DRIVERS_COLUMN = "top_drivers"
+
+# --------------------------------------------------------------------------------
+# 1. READING / WRITING
+# --------------------------------------------------------------------------------
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def iter_chunks(path, chunksize):
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class ChunkWriter:
+    """Appends scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet = _is_parquet(path)
+        self._writer = None
+        self._first = True
+
+    def write(self, frame):
+        if self._parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            frame.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --------------------------------------------------------------------------------
+# 2. SCORING
+# --------------------------------------------------------------------------------
+
+def score_frame(model, frame, explainer=None, check_ranges=False):
+    """Return `frame` with risk_pct / risk_level columns appended.
+
+    Rows with a missing feature value (or, with `check_ranges`, a value
+    outside FEATURE_RANGES) are not scored (risk_pct is NaN and risk_level
+    is "invalid"). With an `explain.PathExplainer`, a top_drivers
+    column lists the three largest log-odds contributions per row.
+    """
+    X, valid = feature_matrix(frame, check_ranges)
+    risk = np.full(len(frame), np.nan)
+    if valid.any():
+        rows = pd.DataFrame(X[valid], columns=FEATURES)
+        risk[valid] = model.predict_proba(rows)[:, 1] * 100
+
+    levels = risk_levels(risk)
+    levels[~valid] = "invalid"
+
+    scored = frame.copy()
+    scored[RISK_COLUMN] = risk.round(1)
+    scored[LEVEL_COLUMN] = levels
+    if explainer is not None:
+        from explain import format_drivers, top_drivers
+
+        drivers = np.full(len(frame), "", dtype=object)
+        if valid.any():
+            _, contributions = explainer.contributions(X[valid])
+            drivers[valid] = [format_drivers(top_drivers(c)) for c in contributions]
+        scored[DRIVERS_COLUMN] = drivers
+    return scored
+
+
+_worker_model = None
+_worker_explainer = None
+
+
+def _load_explainer(model_path):
+    from explain import PathExplainer
+    from shared_model import attach_or_load
+
+    # Tree arrays mapped from the shared export instead of recompiled in every worker
+    return PathExplainer(attach_or_load(model_path))
+
+
+def _init_worker(model_path, explain=False):
+    global _worker_model, _worker_explainer
+    _worker_model = read_model(model_path)
+    _worker_explainer = _load_explainer(model_path) if explain else None
+
+
+def _score_in_worker(frame):
+    return score_frame(_worker_model, frame, _worker_explainer)
+
+
+def score_file(input_path, output_path, model_path=MODEL_PATH, chunksize=50_000,
+               workers=1, progress=None, explain=False):
+    """Score `input_path` into `output_path`; returns (rows, seconds)."""
+    start = time.perf_counter()
+    rows = 0
+
+    def report(frame):
+        nonlocal rows
+        rows += len(frame)
+        if progress:
+            progress(rows, time.perf_counter() - start)
+
+    with ChunkWriter(output_path) as writer:
+        if workers <= 1:
+            model = read_model(model_path)
+            explainer = _load_explainer(model_path) if explain else None
+            for chunk in iter_chunks(input_path, chunksize):
+                scored = score_frame(model, chunk, explainer)
+                writer.write(scored)
+                report(scored)
+        else:
+            # Keep at most 2 chunks per worker in flight and write them in order.
+            max_pending = workers * 2
+            pending = deque()
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path, explain)) as pool:
+                for chunk in iter_chunks(input_path, chunksize):
+                    pending.append(pool.submit(_score_in_worker, chunk))
+                    if len(pending) >= max_pending:
+                        scored = pending.popleft().result()
+                        writer.write(scored)
+                        report(scored)
+                while pending:
+                    scored = pending.popleft().result()
+                    writer.write(scored)
+                    report(scored)
+
+    return rows, time.perf_counter() - start
+
+# --------------------------------------------------------------------------------
+# 3. CLI
+# --------------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-score patients with the heart attack model.")
+    parser.add_argument("input", help="CSV or Parquet file with the heart.csv columns")
+    parser.add_argument("-o", "--output", required=True, help="CSV or Parquet output file")
+    parser.add_argument("--model", default=MODEL_PATH, help="pickled model (default: %(default)s)")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="rows per chunk (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1, help="scoring processes (default: %(default)s)")
+    parser.add_argument("--explain", action="store_true", help="add a top_drivers column per row")
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    args = parser.parse_args(argv)
+
+    def progress(rows, elapsed):
+        print(f"\r{rows:,} rows  {rows / max(elapsed, 1e-9):,.0f} rows/sec", end="", file=sys.stderr)
+
+    rows, elapsed = score_file(
+        args.input, args.output, model_path=args.model, chunksize=args.chunksize,
+        workers=args.workers, progress=None if args.quiet else progress, explain=args.explain,
+    )
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"Scored {rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec) -> {args.output}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
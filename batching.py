@@ -0,0 +1,105 @@
+"""Micro-batching scheduler shared by all Streamlit sessions.
+
+Each session thread calls `BatchScheduler.predict(row)`. The scheduler's
+worker thread waits up to `max_wait_ms` for more rows (at most `max_batch`),
+scores them with one vectorized `predict_proba` call and resolves every
+caller's future, so concurrent "Analyze Risk" clicks share one model call
+instead of contending for the GIL with separate 1-row calls.
+
+Rows submitted with a `version` are only batched with rows for the same
+version and scored with `predict_proba(X, version)`, so one scheduler can
+serve every model version during a hot swap.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from telemetry import REGISTRY, span
+
+
+class BatchScheduler:
+    def __init__(self, predict_proba, max_batch=32, max_wait_ms=2.0):
+        self.predict_proba = predict_proba
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue_depth = REGISTRY.histogram("heart_batch_queue_depth", [1, 2, 4, 8, 16, 32, 64, 128])
+        self.batch_size = REGISTRY.histogram("heart_batch_size", [1, 2, 4, 8, 16, 32, 64])
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, row, version=None):
+        """Queue one feature vector; the future resolves to P(heart disease)."""
+        future = Future()
+        self._queue.put((np.asarray(row, dtype=float), future, version))
+        return future
+
+    def predict(self, row, timeout=10.0, version=None):
+        return self.submit(row, version).result(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "pending": self._queue.qsize(),
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            first = self._queue.get()
+            if first is None:
+                continue
+            self.queue_depth.observe(self._queue.qsize() + 1)
+            batch = self._collect(first)
+            self.batch_size.observe(len(batch))
+
+            by_version = {}
+            for row, future, version in batch:
+                if future.set_running_or_notify_cancel():
+                    by_version.setdefault(version, []).append((row, future))
+            for version, live in by_version.items():
+                self._score(live, version)
+
+    def _score(self, live, version):
+        try:
+            X = np.vstack([row for row, _ in live])
+            with span("predict_proba", rows=len(live)):
+                proba = self.predict_proba(X) if version is None else self.predict_proba(X, version)
+        except Exception as e:
+            for _, future in live:
+                future.set_exception(e)
+            return
+        for (_, future), p in zip(live, proba[:, 1]):
+            future.set_result(float(p))
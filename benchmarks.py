@@ -0,0 +1,293 @@
+"""Benchmark suite for the prediction hot path.
+
+Measures each part of an "Analyze Risk" click separately and prints JSON
+with p50/p95/p99 latencies (microseconds):
+
+    python benchmarks.py                         # all groups, JSON to stdout
+    python benchmarks.py -o bench.json --only predict mapping
+    python benchmarks.py --compare old.json      # exit 1 if a p50 regressed > 20%
+
+Firebase and SMTP are measured against local fakes (`InMemoryDatabase` and a
+minimal in-process SMTP server), so numbers reflect our own overhead, not
+the network.
+"""
+import argparse
+import json
+import os
+import platform
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from heart_model import MODEL_PATH, form_to_features, model_fingerprint, read_model
+
+BATCH_SIZES = [1, 8, 64, 512, 4096]
+
+SAMPLE_FORM = (
+    50, "Male", "Typical Angina (Pressure/Squeeze)", 120, 200, "No (Normal)", "Normal",
+    150, "No", 0.0, "Upsloping (Healthy/Normal)", "0", "Normal",
+)
+
+SAMPLE_RECORD = {
+    "Patient_Name": "Benchmark Patient", "Age": 50, "Sex": "Male", "BloodPressure": 120,
+    "Cholesterol": 200, "HeartRate": 150, "Prediction": "12.3% (Low Risk)",
+    "Doctor_Email": "doctor@example.com", "Timestamp": "2024-01-01T00:00:00",
+}
+
+# --------------------------------------------------------------------------------
+# 1. MEASUREMENT
+# --------------------------------------------------------------------------------
+
+def measure(fn, repeat=None, min_time=0.5, max_repeat=10_000, warmup=3):
+    """Call `fn` repeatedly and summarize per-call latency in microseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < (repeat or max_repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+        if repeat is None and time.perf_counter() > deadline and len(samples) >= 20:
+            break
+    samples = np.asarray(samples)
+    return {
+        "n": int(len(samples)),
+        "mean_us": float(samples.mean()),
+        "p50_us": float(np.percentile(samples, 50)),
+        "p95_us": float(np.percentile(samples, 95)),
+        "p99_us": float(np.percentile(samples, 99)),
+    }
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib (no TLS, no auth)."""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self._reply("220 localhost benchmark SMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 localhost")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.received += 1
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.received = 0
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+# --------------------------------------------------------------------------------
+# 2. BENCHMARK GROUPS
+# --------------------------------------------------------------------------------
+
+def bench_load(model_path):
+    from fast_model import CompiledEnsemble, snapshot_path_for
+
+    read_model(model_path)  # import sklearn once so only unpickling is timed
+    results = {"load.unpickle": measure(lambda: read_model(model_path), repeat=10)}
+    snapshot = snapshot_path_for(model_path)
+    if os.path.exists(snapshot):
+        results["load.snapshot"] = measure(lambda: CompiledEnsemble.load(snapshot), repeat=20)
+    results["load.fingerprint"] = measure(lambda: model_fingerprint(model_path))
+    return results
+
+
+def bench_predict(model_path):
+    from fast_model import CompiledEnsemble
+
+    model = read_model(model_path)
+    compiled = CompiledEnsemble.from_sklearn(model)
+    rng = np.random.default_rng(0)
+    base = np.asarray(form_to_features(*SAMPLE_FORM), dtype=float)
+
+    results = {}
+    for size in BATCH_SIZES:
+        X = base + rng.normal(0, 1, (size, len(base)))
+        results[f"predict.sklearn.batch{size}"] = measure(lambda: model.predict_proba(X), min_time=0.3)
+        results[f"predict.compiled.batch{size}"] = measure(lambda: compiled.predict_proba(X), min_time=0.3)
+    return results
+
+
+def bench_mapping():
+    from prediction_cache import PredictionCache
+
+    cache = PredictionCache()
+    features = form_to_features(*SAMPLE_FORM)
+    cache.put(features, "bench", 0.5)
+    return {
+        "mapping.form_to_features": measure(lambda: form_to_features(*SAMPLE_FORM)),
+        "mapping.asarray_reshape": measure(lambda: np.asarray(features).reshape(1, -1)),
+        "mapping.cache_hit": measure(lambda: cache.get(features, "bench")),
+    }
+
+
+def bench_persistence(tmp_dir):
+    from firebase_writer import InMemoryDatabase, RecordWriter
+
+    db = InMemoryDatabase()
+    writer = RecordWriter(db, queue_path=os.path.join(tmp_dir, "bench_queue.sqlite3"), max_batch=10**9)
+    results = {
+        "db.push_direct": measure(lambda: db.child("Patients_Analysis").push(SAMPLE_RECORD)),
+        "db.push_write_behind": measure(lambda: writer.push(SAMPLE_RECORD), max_repeat=2000),
+    }
+    results["db.flush_per_record"] = _per_record(writer.flush, writer.pending())
+    return results
+
+
+def _per_record(fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = (time.perf_counter() - start) * 1e6 / max(count, 1)
+    return {"n": int(count), "mean_us": elapsed, "p50_us": elapsed, "p95_us": elapsed, "p99_us": elapsed}
+
+
+def bench_email(tmp_dir):
+    import smtplib
+
+    from email_queue import EmailOutbox
+
+    server = LocalSMTPServer()
+
+    def message():
+        from app import build_report_message
+        return build_report_message("bench@example.com", "doctor@example.com", "Benchmark report")
+
+    try:
+        msg = message()
+    except Exception:
+        from email.mime.text import MIMEText
+        msg = MIMEText("Benchmark report")
+        msg["From"], msg["To"], msg["Subject"] = "bench@example.com", "doctor@example.com", "Benchmark"
+
+    def send_direct():
+        # What send_email_report used to do per click: connect, send, quit.
+        smtp = smtplib.SMTP("127.0.0.1", server.port)
+        smtp.send_message(msg)
+        smtp.quit()
+
+    outbox = EmailOutbox(os.path.join(tmp_dir, "bench_outbox.sqlite3"), host="127.0.0.1",
+                         port=server.port, use_starttls=False, batch_size=100)
+    results = {
+        "email.send_direct": measure(send_direct, max_repeat=300),
+        "email.enqueue": measure(lambda: outbox.enqueue(msg), max_repeat=300),
+    }
+    queued = outbox.stats()["queued"]
+    outbox.start()
+    results["email.outbox_delivery_per_message"] = _per_record(lambda: outbox.flush(60), queued)
+    outbox.stop()
+    server.shutdown()
+    return results
+
+
+GROUPS = ["load", "predict", "mapping", "persistence", "email"]
+
+# --------------------------------------------------------------------------------
+# 3. REPORTING
+# --------------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(groups=GROUPS, model_path=MODEL_PATH, tmp_dir=".cache/bench"):
+    os.makedirs(tmp_dir, exist_ok=True)
+    results = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for group in groups:
+            if group == "load":
+                results.update(bench_load(model_path))
+            elif group == "predict":
+                results.update(bench_predict(model_path))
+            elif group == "mapping":
+                results.update(bench_mapping())
+            elif group == "persistence":
+                results.update(bench_persistence(tmp_dir))
+            elif group == "email":
+                results.update(bench_email(tmp_dir))
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "model": model_path,
+            "model_version": model_fingerprint(model_path),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """Return the names whose p50 got slower than baseline by more than `threshold`."""
+    regressions = []
+    for name, stats in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old and old["p50_us"] > 0 and stats["p50_us"] > old["p50_us"] * (1 + threshold):
+            regressions.append((name, old["p50_us"], stats["p50_us"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prediction hot path.")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, help="benchmark groups to run")
+    parser.add_argument("--model", default=MODEL_PATH, help="model artifact (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown (default: 20%%)")
+    args = parser.parse_args(argv)
+
+    report = run(args.only or GROUPS, args.model)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: p50 {old:.1f}us -> {new:.1f}us", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
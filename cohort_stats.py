@@ -0,0 +1,293 @@
+"""Incrementally maintained cohort statistics for the Insight tab.
+
+`CohortStats` folds in one `Patients_Analysis` record at a time (O(1) per
+record) and keeps everything the dashboard shows: risk-band counts, volume
+per doctor and per day, fixed-bin histograms of age / cholesterol / blood
+pressure, relative-error quantile sketches (DDSketch-style) and a HyperLogLog
+estimate of distinct patients. All parts are mergeable, so stats built on
+different servers (or from different time ranges) can be combined with
+`merge`, and reading them never touches the history.
+
+`CohortTracker` persists the stats to disk together with the last Firebase
+push key seen. On startup it loads that state and fetches only records with
+a later key (push keys sort chronologically), then `observe` keeps it current
+as app_one saves new records. (Records another server saves under an
+earlier key than this server's latest one are not picked up.)
+"""
+import atexit
+import base64
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+from firebase_writer import private_ref
+from heart_model import FEATURE_RANGES, risk_level
+
+STATS_PATH = ".cache/cohort_stats.json"
+RECORDS_PATH = "Patients_Analysis"
+
+# Histogram bins shown in the Insight tab: (record field, lower edge, upper edge, bin width)
+HISTOGRAMS = {
+    "age": ("Age", *FEATURE_RANGES["age"], 5),
+    "chol": ("Cholesterol", *FEATURE_RANGES["chol"], 25),
+    "trtbps": ("BloodPressure", *FEATURE_RANGES["trtbps"], 10),
+}
+QUANTILE_FIELDS = {"risk_pct": None, "age": "Age", "chol": "Cholesterol", "trtbps": "BloodPressure"}
+
+# --------------------------------------------------------------------------------
+# 1. SKETCHES
+# --------------------------------------------------------------------------------
+
+class QuantileSketch:
+    """DDSketch-style quantiles: log-spaced buckets, every answer within `alpha` relative error."""
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            # Only non-negative clinical values are tracked; zero gets its own bucket.
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {"alpha": self.alpha, "buckets": {str(k): v for k, v in self.buckets.items()},
+                "zeros": self.zeros, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["alpha"])
+        sketch.buckets = Counter({int(k): v for k, v in data["buckets"].items()})
+        sketch.zeros, sketch.count = data["zeros"], data["count"]
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count estimate in 2**p one-byte registers (~1.6% error at p=12)."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # small-range correction
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(self.registers.tobytes()).decode()}
+
+    @classmethod
+    def from_dict(cls, data):
+        hll = cls(data["p"])
+        hll.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return hll
+
+# --------------------------------------------------------------------------------
+# 2. COHORT AGGREGATES
+# --------------------------------------------------------------------------------
+
+def parse_prediction(text):
+    """"12.3% (Low Risk)" -> (12.3, "low")."""
+    pct = float(str(text).split("%")[0])
+    return pct, risk_level(pct)
+
+
+class CohortStats:
+    def __init__(self):
+        self.total = 0
+        self.bands = Counter()
+        self.doctors = Counter()
+        self.days = Counter()
+        self.histograms = {name: np.zeros(int(math.ceil((hi - lo) / width)) + 2, dtype=np.int64)
+                           for name, (_, lo, hi, width) in HISTOGRAMS.items()}
+        self.quantiles = {name: QuantileSketch() for name in QUANTILE_FIELDS}
+        self.patients = HyperLogLog()
+
+    def update(self, record):
+        """Fold in one Patients_Analysis record."""
+        pct, band = parse_prediction(record["Prediction"])
+        self.total += 1
+        self.bands[band] += 1
+        self.doctors[record.get("Doctor_Email") or "unknown"] += 1
+        self.days[str(record.get("Timestamp", ""))[:10]] += 1
+        self.quantiles["risk_pct"].add(pct)
+        for name, (field, lo, hi, width) in HISTOGRAMS.items():
+            value = record.get(field)
+            if value is None:
+                continue
+            # Bin 0 / last bin collect values below / above the form range.
+            counts = self.histograms[name]
+            if value < lo:
+                counts[0] += 1
+            elif value > hi:
+                counts[-1] += 1
+            else:
+                counts[min(int((value - lo) // width) + 1, len(counts) - 2)] += 1
+        for name, field in QUANTILE_FIELDS.items():
+            if field and record.get(field) is not None:
+                self.quantiles[name].add(float(record[field]))
+        self.patients.add(f"{record.get('Doctor_Email', '')}|{str(record.get('Patient_Name', '')).strip().lower()}")
+
+    def merge(self, other):
+        self.total += other.total
+        self.bands.update(other.bands)
+        self.doctors.update(other.doctors)
+        self.days.update(other.days)
+        for name, counts in other.histograms.items():
+            self.histograms[name] += counts
+        for name, sketch in other.quantiles.items():
+            self.quantiles[name].merge(sketch)
+        self.patients.merge(other.patients)
+        return self
+
+    def histogram(self, name):
+        """[(bin label, count)] including the below/above-range bins when non-empty."""
+        _, lo, hi, width = HISTOGRAMS[name]
+        counts = self.histograms[name]
+        labels = [f"<{lo}"] + [f"{lo + i * width}-{min(lo + (i + 1) * width, hi)}"
+                               for i in range(len(counts) - 2)] + [f">{hi}"]
+        return [(label, int(c)) for i, (label, c) in enumerate(zip(labels, counts))
+                if c or 0 < i < len(counts) - 1]
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "bands": dict(self.bands),
+            "doctors": dict(self.doctors),
+            "days": dict(self.days),
+            "histograms": {k: v.tolist() for k, v in self.histograms.items()},
+            "quantiles": {k: v.to_dict() for k, v in self.quantiles.items()},
+            "patients": self.patients.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.total = data["total"]
+        stats.bands, stats.doctors, stats.days = (Counter(data[k]) for k in ("bands", "doctors", "days"))
+        for name, counts in data["histograms"].items():
+            if name in stats.histograms and len(counts) == len(stats.histograms[name]):
+                stats.histograms[name] = np.asarray(counts, dtype=np.int64)
+        stats.quantiles.update({k: QuantileSketch.from_dict(v) for k, v in data["quantiles"].items()})
+        stats.patients = HyperLogLog.from_dict(data["patients"])
+        return stats
+
+# --------------------------------------------------------------------------------
+# 3. TRACKER (persistence + catch-up)
+# --------------------------------------------------------------------------------
+
+def fetch_records_after(db, last_key=None, path=RECORDS_PATH, token=None):
+    """(key, record) pairs under `path` with a push key after `last_key`, in key order."""
+    ref = private_ref(db).child(path)
+    if last_key and hasattr(ref, "order_by_key"):
+        ref = ref.order_by_key().start_at(last_key)
+    result = ref.get(token=token)
+    data = result.val() if hasattr(result, "val") else result
+    items = sorted((data or {}).items())
+    return [(k, v) for k, v in items if not last_key or k > last_key]
+
+
+class CohortTracker:
+    def __init__(self, path=STATS_PATH, save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self.stats = CohortStats()
+        self.last_key = None
+        self._dirty = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                self.stats = CohortStats.from_dict(data["stats"])
+                self.last_key = data.get("last_key")
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Cohort Stats Error ({path}): {e}")
+        atexit.register(self.save)
+
+    def catch_up(self, db, token=None):
+        """Fold in records saved since the last run; returns how many were added."""
+        records = fetch_records_after(db, self.last_key, token=token)
+        for key, record in records:
+            self.observe(key, record, autosave=False)
+        self.save()
+        return len(records)
+
+    def observe(self, key, record, autosave=True):
+        with self._lock:
+            if key is not None and self.last_key is not None and key <= self.last_key:
+                return  # already counted (e.g. seen again during catch-up)
+            try:
+                self.stats.update(record)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Cohort Stats Error: skipped record {key} ({e})")
+                return
+            if key is not None:
+                self.last_key = key
+            self._dirty += 1
+            due = autosave and self._dirty >= self.save_every
+        if due:
+            self.save()
+
+    def snapshot(self):
+        """Independent copy of the current stats (cost independent of history size)."""
+        with self._lock:
+            return CohortStats.from_dict(self.stats.to_dict())
+
+    def save(self):
+        with self._lock:
+            if not self._dirty and os.path.exists(self.path):
+                return
+            data = {"stats": self.stats.to_dict(), "last_key": self.last_key}
+            self._dirty = 0
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,282 @@
+"""Input-drift and calibration monitor for live predictions.
+
+Each feature's reference distribution is binned once from heart.csv: one bin
+per code for the categorical features, decile bins for the others. Live
+inputs are kept in a sliding window (a ring buffer of bin indices), so
+`observe` only moves one row into and one row out of the per-bin counts,
+O(1) work and a few microseconds per prediction:
+
+    monitor = DriftMonitor()
+    monitor.observe(row, proba, key)          # row in FEATURES order, proba in [0, 1]
+    monitor.record_outcome(key, 1)            # back-filled diagnosis for that prediction
+    monitor.report()                          # PSI / KS per feature, calibration, active alerts
+
+Every `check_every` observations the window is compared with the reference
+(PSI and the binned Kolmogorov-Smirnov distance) and, once outcomes come in,
+the calibration of the predicted probabilities (expected calibration error
+and Brier score over the last `calibration_window` outcomes). A feature or
+the calibration crossing its threshold raises one alert until it recovers.
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from heart_model import CONTINUOUS_FEATURES, FEATURE_RANGES, FEATURES
+from telemetry import REGISTRY
+
+PSI_THRESHOLD = 0.2      # >0.2 is the usual "significant shift" cut-off
+KS_THRESHOLD = 0.2
+ECE_THRESHOLD = 0.1
+CALIBRATION_BINS = 10
+_MIN_PROPORTION = 1e-4   # keeps PSI finite when a bin is empty on one side
+
+REGISTRY.describe("heart_drift_alerts_total", "Drift and calibration alerts raised.")
+
+# --------------------------------------------------------------------------------
+# 1. REFERENCE DISTRIBUTIONS
+# --------------------------------------------------------------------------------
+
+def _edges(name, values, quantile_bins):
+    lo, hi = FEATURE_RANGES[name]
+    if name not in CONTINUOUS_FEATURES and hi - lo <= quantile_bins:
+        # One bin per code, plus a bin on each side for out-of-range codes.
+        return [v + 0.5 for v in range(int(lo) - 1, int(hi) + 1)]
+    qs = np.quantile(values, np.linspace(0, 1, quantile_bins + 1)[1:-1])
+    return sorted(set(float(q) for q in qs))
+
+
+def build_reference(table=None, quantile_bins=10):
+    """{feature: (bin edges, reference proportions)} from heart.csv (or an Arrow/pandas table)."""
+    if table is None:
+        from history_store import reference_table
+        table = reference_table()
+    reference = {}
+    for name in FEATURES:
+        column = table[name]
+        values = np.asarray(column.to_numpy() if hasattr(column, "to_numpy") else column, dtype=float)
+        edges = _edges(name, values, quantile_bins)
+        counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+        reference[name] = (edges, counts / counts.sum())
+    return reference
+
+
+def psi(expected, actual):
+    """Population stability index between two binned distributions."""
+    e = np.maximum(expected, _MIN_PROPORTION)
+    a = np.maximum(actual, _MIN_PROPORTION)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks_distance(expected, actual):
+    """Largest gap between the two cumulative distributions (KS statistic on the bins)."""
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+# --------------------------------------------------------------------------------
+# 2. MONITOR
+# --------------------------------------------------------------------------------
+
+class DriftMonitor:
+    def __init__(self, reference=None, window=500, min_samples=100, check_every=50,
+                 psi_threshold=PSI_THRESHOLD, ks_threshold=KS_THRESHOLD, ece_threshold=ECE_THRESHOLD,
+                 calibration_window=500, min_outcomes=200, max_pending=100_000, on_alert=None):
+        self.reference = reference or build_reference()
+        self.window = window
+        self.min_samples = min_samples
+        self.check_every = check_every
+        self.psi_threshold = psi_threshold
+        self.ks_threshold = ks_threshold
+        self.ece_threshold = ece_threshold
+        self.min_outcomes = min_outcomes
+        self.max_pending = max_pending
+        self.on_alert = list(on_alert or [])
+
+        # All features' bins live in one flat count list; feature i starts at _offsets[i].
+        self._edges = [self.reference[name][0] for name in FEATURES]
+        sizes = [len(edges) + 1 for edges in self._edges]
+        self._offsets = [int(o) for o in np.cumsum([0] + sizes[:-1])]
+        self._expected = np.concatenate([self.reference[name][1] for name in FEATURES])
+        self._counts = [0] * sum(sizes)
+        self._ring = [None] * window
+        self._next = 0
+        self.size = 0
+        self.observed = 0
+        self.outcomes = 0
+
+        # Predictions waiting for an outcome, and the sliding calibration window
+        self._pending = OrderedDict()
+        self._outcomes = deque(maxlen=calibration_window)
+        self._cal_count = [0] * CALIBRATION_BINS
+        self._cal_proba = [0.0] * CALIBRATION_BINS
+        self._cal_positive = [0] * CALIBRATION_BINS
+        self._brier = 0.0
+
+        self.active = {}         # alert key -> alert dict, while the condition holds
+        self.last_drift = {}
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------------------------
+    # Hot path
+    # ----------------------------------------------------------------------------
+
+    def observe(self, row, proba=None, key=None):
+        """Add one scored input (FEATURES order) to the window; remember `proba` under `key`."""
+        if hasattr(row, "tolist"):
+            row = row.tolist()
+        bins = [offset + bisect_right(edges, value) for offset, edges, value in zip(self._offsets, self._edges, row)]
+        with self._lock:
+            old = self._ring[self._next]
+            self._ring[self._next] = bins
+            self._next = (self._next + 1) % self.window
+            counts = self._counts
+            if old is None:
+                self.size += 1
+            else:
+                for b in old:
+                    counts[b] -= 1
+            for b in bins:
+                counts[b] += 1
+            self.observed += 1
+            if key is not None and proba is not None:
+                self._pending[key] = float(proba)
+                if len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+            due = self.observed % self.check_every == 0
+        if due:
+            self.check()
+
+    def record_outcome(self, key, outcome, proba=None):
+        """Back-fill the true outcome (0/1) for the prediction stored under `key`.
+
+        Returns False if the prediction is unknown (too old, or made before a
+        restart) and no `proba` was given.
+        """
+        with self._lock:
+            stored = self._pending.pop(key, None)
+            proba = stored if stored is not None else proba
+            if proba is None:
+                return False
+            outcome = int(bool(outcome))
+            b = min(int(proba * CALIBRATION_BINS), CALIBRATION_BINS - 1)
+            if len(self._outcomes) == self._outcomes.maxlen:
+                ob, op, oy = self._outcomes[0]
+                self._cal_count[ob] -= 1
+                self._cal_proba[ob] -= op
+                self._cal_positive[ob] -= oy
+                self._brier -= (op - oy) ** 2
+            self._outcomes.append((b, proba, outcome))
+            self._cal_count[b] += 1
+            self._cal_proba[b] += proba
+            self._cal_positive[b] += outcome
+            self._brier += (proba - outcome) ** 2
+            self.outcomes += 1
+            due = self.outcomes % self.check_every == 0
+        if due:
+            self.check()
+        return True
+
+    # ----------------------------------------------------------------------------
+    # Statistics
+    # ----------------------------------------------------------------------------
+
+    def feature_drift(self):
+        """{feature: {"psi": ..., "ks": ...}} for the current window (empty until it has data)."""
+        with self._lock:
+            size = self.size
+            actual = np.array(self._counts, dtype=float)
+        if not size:
+            return {}
+        actual /= size
+        expected, offsets = self._expected, self._offsets
+        # psi() and ks_distance() for every feature at once, segment by segment
+        e = np.maximum(expected, _MIN_PROPORTION)
+        a = np.maximum(actual, _MIN_PROPORTION)
+        psis = np.add.reduceat((a - e) * np.log(a / e), offsets)
+        gap = np.cumsum(actual - expected)
+        starts = np.concatenate([[0.0], gap[np.array(offsets[1:]) - 1]])
+        gap -= np.repeat(starts, np.diff(offsets + [len(gap)]))
+        kss = np.maximum.reduceat(np.abs(gap), offsets)
+        return {name: {"psi": float(p), "ks": float(k)} for name, p, k in zip(FEATURES, psis, kss)}
+
+    def calibration(self):
+        """Expected calibration error, Brier score and reliability bins over recent outcomes."""
+        with self._lock:
+            n = len(self._outcomes)
+            counts, proba = list(self._cal_count), list(self._cal_proba)
+            positive, brier = list(self._cal_positive), self._brier
+        bins = [
+            {"range": (i / CALIBRATION_BINS, (i + 1) / CALIBRATION_BINS), "count": c,
+             "mean_predicted": p / c if c else None, "observed_rate": y / c if c else None}
+            for i, (c, p, y) in enumerate(zip(counts, proba, positive))
+        ]
+        if not n:
+            return {"count": 0, "ece": None, "brier": None, "bins": bins}
+        ece = sum(abs(p - y) for c, p, y in zip(counts, proba, positive) if c) / n
+        return {"count": n, "ece": ece, "brier": max(brier, 0.0) / n, "bins": bins}
+
+    # ----------------------------------------------------------------------------
+    # Alerts
+    # ----------------------------------------------------------------------------
+
+    def check(self):
+        """Re-evaluate drift and calibration; returns the alerts raised by this check."""
+        raised = []
+        drift = self.feature_drift()
+        self.last_drift = drift
+        if self.size >= self.min_samples:
+            for name, stats in drift.items():
+                firing = stats["psi"] > self.psi_threshold or stats["ks"] > self.ks_threshold
+                raised += self._update_alert(("feature_drift", name), firing, {
+                    "kind": "feature_drift", "feature": name, "window": self.size,
+                    "psi": round(stats["psi"], 4), "ks": round(stats["ks"], 4),
+                })
+        calibration = self.calibration()
+        if calibration["count"] >= self.min_outcomes:
+            raised += self._update_alert(("calibration", None), calibration["ece"] > self.ece_threshold, {
+                "kind": "calibration", "outcomes": calibration["count"],
+                "ece": round(calibration["ece"], 4), "brier": round(calibration["brier"], 4),
+            })
+        for alert in raised:
+            self._emit(alert)
+        return raised
+
+    def _update_alert(self, key, firing, alert):
+        with self._lock:
+            if firing and key not in self.active:
+                self.active[key] = alert
+                return [alert]
+            if firing:
+                self.active[key] = alert
+            elif key in self.active:
+                del self.active[key]
+        return []
+
+    def _emit(self, alert):
+        REGISTRY.inc("heart_drift_alerts_total", kind=alert["kind"], feature=alert.get("feature") or "")
+        details = ", ".join(f"{k}={v}" for k, v in alert.items() if k != "kind")
+        print(f"Drift Alert: {alert['kind']} ({details})")
+        for callback in self.on_alert:
+            try:
+                callback(alert)
+            except Exception as e:
+                print(f"Drift Alert Error: {e}")
+
+    def report(self):
+        return {
+            "window": self.size,
+            "observed": self.observed,
+            "outcomes": self.outcomes,
+            "features": self.last_drift or self.feature_drift(),
+            "calibration": self.calibration(),
+            "alerts": list(self.active.values()),
+        }
+
+    def register_metrics(self, registry=REGISTRY):
+        """Expose the last checked PSI per feature and the calibration error as gauges."""
+        registry.describe("heart_drift_psi", "Population stability index of each input feature.")
+        registry.describe("heart_calibration_ece", "Expected calibration error over back-filled outcomes.")
+        for name in FEATURES:
+            registry.gauge("heart_drift_psi", lambda name=name: self.last_drift[name]["psi"], feature=name)
+        registry.gauge("heart_calibration_ece", lambda: self.calibration()["ece"])
+        return self
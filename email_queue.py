@@ -0,0 +1,300 @@
+"""Background delivery of report emails.
+
+Messages are written to a small SQLite outbox and sent by one worker thread
+that keeps a single authenticated SMTP connection open, sends due messages
+in batches and retries failures with exponential backoff: a message the
+server refuses temporarily (4xx) is retried up to `max_attempts` times, one
+it refuses permanently (5xx) fails at once, and a connection or login
+failure backs off the whole queue without counting against any message.
+The UI only enqueues and later polls `status()`, so a prediction never
+waits on SMTP.
+Sent messages keep only their status row (the body is dropped on delivery),
+and rows older than `retention` seconds are pruned while the worker is idle.
+
+Any SMTP server works, including a local stand-in:
+
+    outbox = EmailOutbox("/tmp/outbox.db", host="localhost", port=1025, use_starttls=False)
+"""
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+
+from telemetry import span
+
+DEFAULT_OUTBOX_PATH = ".cache/email_outbox.sqlite3"
+
+QUEUED = "queued"
+SENT = "sent"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    sent_at REAL
+)
+"""
+
+
+def _is_permanent(error):
+    """5xx replies: retrying the same message will not help."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return error.smtp_code >= 500
+
+
+class EmailOutbox:
+    def __init__(self, path=DEFAULT_OUTBOX_PATH, host="smtp.gmail.com", port=587,
+                 username=None, password=None, use_starttls=True, batch_size=20,
+                 max_attempts=5, backoff=2.0, idle_timeout=60.0, poll_interval=0.5,
+                 timeout=30.0, retention=7 * 24 * 3600, prune_interval=3600.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_starttls = use_starttls
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.retention = retention
+        self.prune_interval = prune_interval
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+
+        self._smtp = None
+        self._last_used = 0.0
+        self._retry_at = 0.0
+        self._connection_failures = 0
+        self._pruned_at = 0.0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------------------------------------------
+    # Public API (safe to call from any Streamlit session thread)
+    # ----------------------------------------------------------------------------
+
+    def enqueue(self, msg):
+        """Queue an email.message / MIME message; returns its outbox id."""
+        return self.enqueue_many([msg])[0]
+
+    def enqueue_many(self, msgs, chunk=500):
+        """Queue several messages (e.g. a roster's reports); returns their ids.
+
+        `msgs` may be a generator. Messages are serialized and committed
+        `chunk` at a time, so a large roster never sits in memory or in one
+        transaction at once, and sending starts with the first chunk.
+        """
+        ids, msgs = [], iter(msgs)
+        while True:
+            now = time.time()
+            rows = []
+            for msg in msgs:
+                recipients = [a.strip() for a in str(msg["To"]).split(",") if a.strip()]
+                rows.append((str(msg["From"]), ",".join(recipients), msg.as_bytes(), QUEUED, now, now))
+                if len(rows) == chunk:
+                    break
+            if not rows:
+                return ids
+            with self._lock:
+                for row in rows:
+                    cur = self._db.execute(
+                        "INSERT INTO outbox (sender, recipients, message, status, next_attempt, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    ids.append(cur.lastrowid)
+                self._db.commit()
+            self._wakeup.set()
+
+    def status(self, message_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, attempts, last_error, sent_at FROM outbox WHERE id = ?", (message_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "attempts": row[1], "error": row[2], "sent_at": row[3]}
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        counts = {QUEUED: 0, SENT: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def prune(self, older_than=None):
+        """Delete sent and failed rows older than `older_than` seconds (default: retention); returns the count."""
+        cutoff = time.time() - (self.retention if older_than is None else older_than)
+        with self._lock:
+            cur = self._db.execute(
+                "DELETE FROM outbox WHERE (status = ? AND sent_at < ?) OR (status = ? AND created < ?)",
+                (SENT, cutoff, FAILED, cutoff),
+            )
+            self._db.commit()
+        return cur.rowcount
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._disconnect()
+
+    def flush(self, timeout=30.0):
+        """Block until nothing is due anymore (used by scripts and tests)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                due = self._db.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status = ? AND next_attempt <= ?",
+                    (QUEUED, time.time()),
+                ).fetchone()[0]
+            if not due:
+                return True
+            self._wakeup.set()
+            time.sleep(0.05)
+        return False
+
+    # ----------------------------------------------------------------------------
+    # Worker
+    # ----------------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._step()
+            except sqlite3.Error as e:
+                # The only delivery thread: log, wait and carry on rather than die.
+                print(f"Email Error (outbox): {e}")
+                self._stopping.wait(self.poll_interval)
+
+    def _step(self):
+        if time.monotonic() < self._retry_at:
+            self._stopping.wait(min(self.poll_interval, self._retry_at - time.monotonic()))
+            return
+        batch = self._due_batch()
+        if batch:
+            self._send_batch(batch)
+            return
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self._disconnect()
+        if time.monotonic() - self._pruned_at > self.prune_interval:
+            self._pruned_at = time.monotonic()
+            try:
+                self.prune()
+            except sqlite3.Error as e:
+                print(f"Email Error (prune): {e}")
+        self._wakeup.wait(self.poll_interval)
+        self._wakeup.clear()
+
+    def _due_batch(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, sender, recipients, message, attempts FROM outbox "
+                "WHERE status = ? AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (QUEUED, time.time(), self.batch_size),
+            ).fetchall()
+
+    def _connect(self):
+        if self._smtp is not None:
+            return self._smtp
+        with span("smtp_connect", host=self.host):
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.use_starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+            except Exception:
+                smtp.close()
+                raise
+        self._smtp = smtp
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    def _send_batch(self, batch):
+        for message_id, sender, recipients, raw, attempts in batch:
+            try:
+                with span("smtp_send"):
+                    try:
+                        self._connect().sendmail(sender, recipients.split(","), raw)
+                    except smtplib.SMTPServerDisconnected:
+                        # The server dropped the idle connection; reconnect once.
+                        self._smtp = None
+                        self._connect().sendmail(sender, recipients.split(","), raw)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                # Problem with this message only; the connection is still usable.
+                self._mark_failed(message_id, attempts + 1, e, permanent=_is_permanent(e))
+            except Exception as e:
+                # Connection-level problem: back off the whole queue; the message keeps its attempts.
+                self._disconnect()
+                self._note_error(message_id, e)
+                self._connection_failures += 1
+                self._retry_at = time.monotonic() + self.backoff ** min(self._connection_failures, 8)
+                return
+            else:
+                self._mark_sent(message_id)
+                self._connection_failures = 0
+            self._last_used = time.monotonic()
+
+    def _mark_sent(self, message_id):
+        # The body is not needed once delivered; keeping only the status row stops the outbox growing
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL, sent_at = ?, "
+                "message = x'' WHERE id = ?",
+                (SENT, time.time(), message_id),
+            )
+            self._db.commit()
+
+    def _note_error(self, message_id, error):
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET last_error = ? WHERE id = ?", (f"{type(error).__name__}: {error}", message_id)
+            )
+            self._db.commit()
+        print(f"Email Error (connection, {self._connection_failures + 1} in a row): {error}")
+
+    def _mark_failed(self, message_id, attempts, error, permanent=False):
+        status = FAILED if permanent or attempts >= self.max_attempts else QUEUED
+        next_attempt = time.time() + self.backoff ** attempts
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (status, attempts, next_attempt, f"{type(error).__name__}: {error}", message_id),
+            )
+            self._db.commit()
+        print(f"Email Error (id={message_id}, attempt {attempts}): {error}")
+
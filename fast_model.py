@@ -0,0 +1,181 @@
+"""Flat-array evaluation of the pickled GradientBoostingClassifier.
+
+`CompiledEnsemble.from_sklearn` packs every tree of the ensemble into a few
+contiguous NumPy arrays once. `predict_proba` then walks all trees for all
+rows at the same time (one gather per tree level), which skips sklearn's
+per-call validation and its per-estimator Python loop.
+
+The packed arrays can be saved as a plain .npz snapshot next to the pickle;
+`load_compiled_model` prefers that snapshot, which loads without importing
+sklearn at all.
+"""
+import os
+
+import numpy as np
+
+from heart_model import MODEL_PATH, model_fingerprint, read_model
+
+# Rows evaluated per step; keeps the (rows x trees) index matrix cache-sized.
+_BLOCK_ROWS = 1024
+
+
+class CompiledEnsemble:
+    """Binary log-loss gradient boosting ensemble stored as packed arrays.
+
+    All nodes of all trees live in the same flat arrays. `roots[t]` is the
+    first node of tree t, `left`/`right` hold absolute node indices and leaves
+    point to themselves, so walking `max_depth` levels always ends on a leaf.
+    `value` holds the (unscaled) value of every node, internal nodes included,
+    and `cover` the training weight that reached each node (used by explain.py).
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots,
+                 init_raw, learning_rate, max_depth, n_features, classes, cover=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.init_raw = float(init_raw)
+        self.learning_rate = float(learning_rate)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.classes_ = np.asarray(classes)
+        self.cover = cover
+
+    @classmethod
+    def from_sklearn(cls, model):
+        if getattr(model, "loss", None) not in ("log_loss", "deviance") or len(model.classes_) != 2:
+            raise ValueError("Only binary log-loss GradientBoostingClassifier models can be compiled")
+
+        trees = [est.tree_ for est in model.estimators_[:, 0]]
+        sizes = np.array([t.node_count for t in trees])
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+
+        feature, threshold, left, right, value, cover = [], [], [], [], [], []
+        for tree, offset in zip(trees, roots):
+            own = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, own, tree.children_left + offset))
+            right.append(np.where(is_leaf, own, tree.children_right + offset))
+            value.append(tree.value[:, 0, 0])
+            cover.append(tree.weighted_n_node_samples)
+
+        n_features = model.n_features_in_
+        init_raw = model._raw_predict_init(np.zeros((1, n_features), dtype=np.float32))[0, 0]
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            value=np.concatenate(value).astype(np.float64),
+            roots=roots,
+            init_raw=init_raw,
+            learning_rate=model.learning_rate,
+            max_depth=max(t.max_depth for t in trees),
+            n_features=n_features,
+            classes=model.classes_,
+            cover=np.concatenate(cover).astype(np.float64),
+        )
+
+    def save(self, path, source_version=""):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                feature=self.feature, threshold=self.threshold, left=self.left,
+                right=self.right, value=self.value, roots=self.roots,
+                params=np.array([self.init_raw, self.learning_rate, self.max_depth, self.n_features_in_]),
+                classes=self.classes_,
+                cover=self.cover if self.cover is not None else np.empty(0),
+                source_version=np.array(source_version),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            init_raw, learning_rate, max_depth, n_features = z["params"]
+            model = cls(
+                feature=z["feature"], threshold=z["threshold"], left=z["left"],
+                right=z["right"], value=z["value"], roots=z["roots"],
+                init_raw=init_raw, learning_rate=learning_rate, max_depth=max_depth,
+                n_features=n_features, classes=z["classes"],
+                cover=z["cover"] if "cover" in z.files and z["cover"].size else None,
+            )
+            model.source_version = str(z["source_version"])
+        return model
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def _as_matrix(self, X):
+        # sklearn compares float32 inputs against float64 thresholds; do the same.
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got {X.shape[1]}")
+        return X
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)."""
+        X = np.ascontiguousarray(self._as_matrix(X))
+        flat = X.ravel()
+        row_start = (np.arange(len(X)) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            x = np.take(flat, row_start + np.take(self.feature, node))
+            go_left = x <= np.take(self.threshold, node)
+            node = np.where(go_left, np.take(self.left, node), np.take(self.right, node))
+        return node
+
+    def decision_function(self, X):
+        X = self._as_matrix(X)
+        raw = np.empty(len(X))
+        for start in range(0, len(X), _BLOCK_ROWS):
+            block = X[start:start + _BLOCK_ROWS]
+            leaves = self.apply(block)
+            raw[start:start + len(block)] = np.take(self.value, leaves).sum(axis=1)
+        return self.init_raw + self.learning_rate * raw
+
+    def predict_proba(self, X):
+        p = 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+def snapshot_path_for(model_path):
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def load_compiled_model(model_path=MODEL_PATH):
+    """Load the compiled ensemble, from the .npz snapshot when it is current.
+
+    The snapshot records the fingerprint of the pickle it was built from; if
+    the pickle changed (or there is no snapshot) the pickle is compiled again
+    and the snapshot rewritten.
+    """
+    version = model_fingerprint(model_path)
+    snapshot = snapshot_path_for(model_path)
+    if os.path.exists(snapshot):
+        try:
+            model = CompiledEnsemble.load(snapshot)
+            if model.source_version == version and model.cover is not None:
+                return model
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Snapshot Error ({snapshot}): {e}")
+
+    model = CompiledEnsemble.from_sklearn(read_model(model_path))
+    model.source_version = version
+    try:
+        tmp = f"{snapshot}.{os.getpid()}.tmp"
+        model.save(tmp, version)
+        os.replace(tmp, snapshot)
+    except OSError as e:
+        print(f"Snapshot Error ({snapshot}): {e}")
+    return model
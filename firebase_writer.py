@@ -0,0 +1,314 @@
+"""Write-behind layer for Firebase realtime DB records.
+
+`RecordWriter.push` stores the record in a local SQLite queue and returns a
+Firebase-style push key at once. A background thread drains the queue with
+one multi-path `update` per batch (flushing when `max_batch` records are
+waiting or `flush_interval` seconds have passed), so the Streamlit request
+never waits on Firebase. Records still in the queue are sent after a restart.
+
+Each record can name its `owner` (the signed-in session that produced it);
+the flush asks `token(owner)` for that session's current ID token, so a
+record is only ever written with its own user's credentials. Records whose
+session has ended are written without a token, as plain pyrebase pushes are.
+
+Network and server errors back off the whole queue. A batch the database
+rejects (an HTTP 4xx, e.g. the rules refuse a write without a token) only
+backs off its own records and the rest of the queue keeps flowing; after
+`max_attempts` rejections the records move to the `dead_letter` table.
+
+Works with the pyrebase `db` object from Login.py or with `InMemoryDatabase`.
+"""
+import copy
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from telemetry import span
+
+DEFAULT_QUEUE_PATH = ".cache/firebase_queue.sqlite3"
+
+_MIGRATIONS = {
+    # Columns added since the first queue files
+    "owner": "ALTER TABLE pending ADD COLUMN owner TEXT",
+    "attempts": "ALTER TABLE pending ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+    "next_attempt": "ALTER TABLE pending ADD COLUMN next_attempt REAL NOT NULL DEFAULT 0",
+}
+
+_PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_push_lock = threading.Lock()
+_last_push_ms = 0
+_last_rand = []
+
+
+def generate_push_key():
+    """Chronologically sortable key in the same format as Firebase push IDs."""
+    global _last_push_ms, _last_rand
+    with _push_lock:
+        now = int(time.time() * 1000)
+        if now == _last_push_ms:
+            # Same millisecond: increment the random part to keep keys ordered.
+            i = 11
+            while i >= 0 and _last_rand[i] == 63:
+                _last_rand[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_rand[i] += 1
+        else:
+            _last_rand = [random.randrange(64) for _ in range(12)]
+        _last_push_ms = now
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(_PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(time_chars)) + "".join(_PUSH_CHARS[r] for r in _last_rand)
+
+
+def _is_rejection(error):
+    """True when the database answered and refused this write (HTTP 4xx), as opposed to being unreachable."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is not None and 400 <= status < 500
+
+
+def private_ref(db):
+    """A copy of `db` with its own query state.
+
+    pyrebase's Database keeps the path and query built by `child()` /
+    `order_by_key()` on the object itself, so threads sharing one object
+    would overwrite each other's paths.
+    """
+    ref = copy.copy(db)
+    if hasattr(ref, "build_query"):
+        ref.path, ref.build_query = "", {}
+    return ref
+
+
+class RecordWriter:
+    def __init__(self, db, path="Patients_Analysis", queue_path=DEFAULT_QUEUE_PATH,
+                 max_batch=50, flush_interval=2.0, backoff=2.0, max_backoff=60.0, token=None,
+                 max_attempts=5):
+        self.db = db
+        self.path = path
+        # Optional callable owner -> current Firebase ID token or None (see auth_session.AuthManager.token)
+        self.token = token
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        if os.path.dirname(queue_path):
+            os.makedirs(os.path.dirname(queue_path), exist_ok=True)
+        self._queue = sqlite3.connect(queue_path, check_same_thread=False)
+        # WAL keeps each push to one cheap append instead of a full journal sync.
+        self._queue.execute("PRAGMA journal_mode=WAL")
+        self._queue.execute("PRAGMA synchronous=NORMAL")
+        self._queue.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "key TEXT PRIMARY KEY, path TEXT NOT NULL, record TEXT NOT NULL, created REAL NOT NULL, owner TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._queue.execute("PRAGMA table_info(pending)")]
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                self._queue.execute(statement)
+        self._queue.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "key TEXT PRIMARY KEY, path TEXT NOT NULL, record TEXT NOT NULL, created REAL NOT NULL, owner TEXT, "
+            "attempts INTEGER NOT NULL, last_error TEXT, failed_at REAL NOT NULL)"
+        )
+        self._queue.commit()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._failures = 0
+        self.last_error = None
+        self.flushed = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------------------------------------------
+    # Public API
+    # ----------------------------------------------------------------------------
+
+    def push(self, record, owner=None):
+        """Queue `record` under `path` and return the key it will be stored at."""
+        return self.push_many([record], owner)[0]
+
+    def push_many(self, records, owner=None):
+        keys = [generate_push_key() for _ in records]
+        now = time.time()
+        with self._lock:
+            self._queue.executemany(
+                "INSERT INTO pending (key, path, record, created, owner) VALUES (?, ?, ?, ?, ?)",
+                [(k, self.path, json.dumps(r), now, owner) for k, r in zip(keys, records)],
+            )
+            self._queue.commit()
+        if self.pending() >= self.max_batch:
+            self._wakeup.set()
+        return keys
+
+    def pending(self):
+        with self._lock:
+            return self._queue.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def dead_letters(self):
+        """Records given up on after `max_attempts` rejections."""
+        with self._lock:
+            return self._queue.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def flush(self):
+        """Send everything due right now; returns the number of records written.
+
+        Raises when the database cannot be reached; rejected batches are backed
+        off (or dead-lettered) and reported in `last_error` instead.
+        """
+        written, started = 0, time.time()
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    # Rows rejected during this call are due at `started` or later, so they wait for the next one.
+                    rows = self._queue.execute(
+                        "SELECT key, path, record, owner, attempts FROM pending WHERE next_attempt < ? "
+                        "ORDER BY key LIMIT ?", (started, self.max_batch)
+                    ).fetchall()
+                if not rows:
+                    return written
+                groups = {}
+                for key, path, record, owner, attempts in rows:
+                    groups.setdefault((path, owner), {})[key] = (json.loads(record), attempts)
+                for (path, owner), group in groups.items():
+                    token = self.token(owner) if self.token and owner else None
+                    updates = {key: record for key, (record, _) in group.items()}
+                    try:
+                        with span("db_update", path=path, records=len(updates)):
+                            private_ref(self.db).child(path).update(updates, token=token)
+                    except Exception as e:
+                        if not _is_rejection(e):
+                            raise
+                        self._reject(group, e, started)
+                        continue
+                    with self._lock:
+                        self._queue.executemany("DELETE FROM pending WHERE key = ?", [(k,) for k in group])
+                        self._queue.commit()
+                    written += len(group)
+                    self.flushed += len(group)
+
+    def _reject(self, group, error, started):
+        """Back off the records of a rejected batch; dead-letter those out of attempts."""
+        self.last_error = error
+        now, message = time.time(), f"{type(error).__name__}: {error}"
+        retry, dead = [], []
+        for key, (_, attempts) in group.items():
+            attempts += 1
+            if attempts >= self.max_attempts:
+                dead.append((attempts, message, now, key))
+            else:
+                retry.append((attempts, max(now + min(self.backoff ** attempts, self.max_backoff), started), key))
+        with self._lock:
+            self._queue.executemany("UPDATE pending SET attempts = ?, next_attempt = ? WHERE key = ?", retry)
+            self._queue.executemany(
+                "INSERT OR REPLACE INTO dead_letter (key, path, record, created, owner, attempts, last_error, failed_at) "
+                "SELECT key, path, record, created, owner, ?, ?, ? FROM pending WHERE key = ?", dead,
+            )
+            self._queue.executemany("DELETE FROM pending WHERE key = ?", [(row[3],) for row in dead])
+            self._queue.commit()
+        print(f"Firebase Error: {len(group)} record(s) rejected, {len(dead)} dead-lettered ({message})")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="firebase-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Firebase Error: {e}")
+
+    # ----------------------------------------------------------------------------
+    # Worker
+    # ----------------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stopping.is_set():
+            delay = self.flush_interval
+            if self._failures:
+                delay = min(self.backoff ** self._failures, self.max_backoff)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            try:
+                self.last_error = None
+                self.flush()
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                self.last_error = e
+                print(f"Firebase Error: {e}")
+
+
+class InMemoryDatabase:
+    """Minimal stand-in for the pyrebase Database object (child/push/update/get)."""
+
+    def __init__(self, data=None, latency=0.0):
+        self.data = data if data is not None else {}
+        self.latency = latency
+        self.calls = 0
+        self._path = []
+
+    def __copy__(self):
+        return self.child()
+
+    def child(self, *args):
+        ref = InMemoryDatabase(self.data, self.latency)
+        ref._path = self._path + [p for a in args for p in str(a).strip("/").split("/") if p]
+        ref._root = getattr(self, "_root", self)
+        return ref
+
+    def _node(self, create=True):
+        node = self.data
+        for part in self._path:
+            if part not in node:
+                if not create:
+                    return None
+                node[part] = {}
+            node = node[part]
+        return node
+
+    def _call(self):
+        root = getattr(self, "_root", self)
+        root.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def push(self, data, token=None):
+        self._call()
+        key = generate_push_key()
+        self._node()[key] = data
+        return {"name": key}
+
+    def update(self, data, token=None):
+        self._call()
+        node = self._node()
+        for key, value in data.items():
+            target = node
+            parts = key.strip("/").split("/")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+        return data
+
+    def get(self, token=None):
+        self._call()
+        return self._node(create=False)
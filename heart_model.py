@@ -0,0 +1,159 @@
+import hashlib
+import os
+import pickle
+import threading
+
+import numpy as np
+
+# --------------------------------------------------------------------------------
+# 1. SHARED MODEL CONSTANTS
+# --------------------------------------------------------------------------------
+
+MODEL_PATH = "Model_datasets/final_model.pickle"
+DATASET_PATH = "Model_datasets/heart.csv"
+
+# Column order expected by the GradientBoostingClassifier (same layout as heart.csv)
+FEATURES = [
+    "age", "sex", "cp", "trtbps", "chol", "fbs", "restecg",
+    "thalachh", "exng", "oldpeak", "slp", "caa", "thall",
+]
+TARGET = "output"
+
+# Input domain of the app_one form (min, max); every feature except oldpeak is an integer
+FEATURE_RANGES = {
+    "age": (18, 120), "sex": (0, 1), "cp": (0, 3), "trtbps": (80, 200),
+    "chol": (100, 600), "fbs": (0, 1), "restecg": (0, 2), "thalachh": (60, 220),
+    "exng": (0, 1), "oldpeak": (0.0, 10.0), "slp": (0, 2), "caa": (0, 3), "thall": (1, 3),
+}
+CONTINUOUS_FEATURES = ["oldpeak"]
+
+# Risk bands used by the UI, the email report and the batch scorer (percent)
+LOW_RISK_MAX = 30
+MODERATE_RISK_MAX = 60
+
+# A few in-range patients (FEATURES order) used to exercise a model once before serving
+WARM_UP_ROWS = [
+    [50, 1, 0, 120, 200, 0, 0, 150, 0, 0.0, 0, 0, 2],
+    [63, 0, 2, 145, 233, 1, 1, 110, 1, 2.3, 1, 2, 3],
+    [41, 1, 1, 130, 204, 0, 0, 172, 0, 1.4, 2, 0, 1],
+    [57, 1, 3, 140, 192, 0, 1, 148, 0, 0.4, 1, 0, 1],
+]
+
+# --------------------------------------------------------------------------------
+# 2. FORM MAPPING (labels shown in app_one -> heart.csv codes)
+# --------------------------------------------------------------------------------
+
+SEX_MAP = {"Male": 1, "Female": 0}
+FBS_MAP = {'No (Normal)': 0, 'Yes (High)': 1}
+EXANG_MAP = {"No": 0, "Yes": 1}
+
+CP_MAP = {
+    "Typical Angina (Pressure/Squeeze)": 0,
+    "Atypical Angina (Sharp/Stabbing)": 1,
+    "Non-anginal Pain (Not Heart Related)": 2,
+    "Asymptomatic (No Pain)": 3
+}
+
+RESTECG_MAP = {
+    "Normal": 0,
+    "ST-T Wave Abnormality (Irregular)": 1,
+    "Left Ventricular Hypertrophy (Thickened Heart)": 2
+}
+
+SLOPE_MAP = {
+    "Upsloping (Healthy/Normal)": 0,
+    "Flatsloping (Minimal Change)": 1,
+    "Downsloping (Unhealthy Sign)": 2
+}
+
+THAL_MAP = {
+    "Normal": 2,
+    "Fixed Defect (Past Heart Issue)": 1,
+    "Reversible Defect (Current Issue)": 3
+}
+
+
+def form_to_features(age, sex, cp, trestbps, chol, fbs, restecg, thalach,
+                     exang, oldpeak, slope, ca, thal):
+    """Map the app_one form values to the model's feature vector (FEATURES order)."""
+    return [
+        age, SEX_MAP[sex], CP_MAP[cp], trestbps, chol,
+        FBS_MAP[fbs], RESTECG_MAP[restecg], thalach,
+        EXANG_MAP[exang], oldpeak, SLOPE_MAP[slope],
+        int(ca), THAL_MAP[thal]
+    ]
+
+# --------------------------------------------------------------------------------
+# 3. HELPERS
+# --------------------------------------------------------------------------------
+
+def read_model(path=MODEL_PATH):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+_fingerprints = {}
+_fingerprint_lock = threading.Lock()
+
+
+def model_fingerprint(path=MODEL_PATH):
+    """Short sha256 of the model file, re-hashed only when its mtime/size change."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _fingerprint_lock:
+        cached = _fingerprints.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    version = digest.hexdigest()[:16]
+    with _fingerprint_lock:
+        _fingerprints[path] = (stamp, version)
+    return version
+
+
+def risk_level(proba_pct):
+    if proba_pct < LOW_RISK_MAX:
+        return "low"
+    if proba_pct < MODERATE_RISK_MAX:
+        return "moderate"
+    return "high"
+
+
+def risk_levels(proba_pct):
+    """Vectorized `risk_level` for an array of percentages."""
+    proba_pct = np.asarray(proba_pct, dtype=float)
+    levels = np.full(proba_pct.shape, "high", dtype=object)
+    levels[proba_pct < MODERATE_RISK_MAX] = "moderate"
+    levels[proba_pct < LOW_RISK_MAX] = "low"
+    return levels
+
+
+def feature_matrix(frame, check_ranges=False):
+    """Return the model input matrix and a mask of complete rows.
+
+    `frame` is any DataFrame with the heart.csv column names; extra columns
+    are ignored. Raises ValueError when a feature column is missing or cannot
+    be read as a number. With `check_ranges`, rows with a value outside
+    FEATURE_RANGES (the app form's input domain) are not valid either.
+    """
+    import pandas as pd
+
+    missing = [c for c in FEATURES if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    features = frame[FEATURES].apply(pd.to_numeric, errors="coerce")
+    bad = features.isna() & frame[FEATURES].notna()
+    if bad.any().any():
+        column = bad.any()[bad.any()].index[0]
+        raise ValueError(f"Column '{column}' contains non-numeric values")
+
+    valid = features.notna().all(axis=1).to_numpy()
+    X = features.to_numpy(dtype=np.float64)
+    if check_ranges:
+        lo, hi = (np.array([FEATURE_RANGES[f][i] for f in FEATURES]) for i in (0, 1))
+        valid &= ((X >= lo) & (X <= hi)).all(axis=1)
+    return X, valid
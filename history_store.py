@@ -0,0 +1,280 @@
+"""Local columnar history of scored patients, plus heart.csv as Arrow IPC.
+
+Every prediction made in app_one (and every bulk-uploaded roster) is
+appended to a Parquet dataset partitioned by day:
+
+    Model_datasets/history/date=2026-10-16/part-<time>-<id>.parquet
+
+Writes are append-only: `HistoryStore.append` buffers rows and a background
+thread writes them out as a new part file every `flush_interval` seconds (or
+once `max_buffer` rows are waiting), so a click never waits on disk. Rows
+that do not fit the schema (e.g. a cholesterol value too big for int16) are
+set aside in `.rejected.jsonl` next to the partitions instead of holding up
+the rest; only rows that failed to reach the disk are retried. `compact`
+merges a day's small part files into one file sorted by doctor and band.
+
+Reads go through a memory-mapped pyarrow dataset with predicate pushdown:
+the date filter prunes whole partitions and the doctor/band filters use the
+Parquet row-group statistics, so only matching data is decoded:
+
+    store.scan(start="2026-10-01", doctor="d@example.com", band="high")
+
+`reference_table()` returns heart.csv as an uncompressed Arrow IPC file
+mapped straight into memory (zero-copy) instead of re-parsing the CSV.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+
+from heart_model import CONTINUOUS_FEATURES, DATASET_PATH, FEATURES
+
+HISTORY_DIR = "Model_datasets/history"
+
+
+_INTEGER_FEATURES = [f for f in FEATURES if f not in CONTINUOUS_FEATURES]
+
+
+def _schema():
+    import pyarrow as pa
+
+    feature_fields = [
+        pa.field(f, pa.float32() if f in CONTINUOUS_FEATURES else pa.int16()) for f in FEATURES
+    ]
+    return pa.schema([
+        pa.field("timestamp", pa.timestamp("ms", tz="UTC")),
+        pa.field("doctor_email", pa.string()),
+        pa.field("patient_name", pa.string()),
+        pa.field("model_version", pa.string()),
+        pa.field("risk_pct", pa.float32()),
+        pa.field("risk_level", pa.string()),
+        *feature_fields,
+    ])
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).date() if value.tzinfo else value.date()
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+# --------------------------------------------------------------------------------
+# 1. REFERENCE DATASET
+# --------------------------------------------------------------------------------
+
+def reference_table(csv_path=DATASET_PATH, arrow_path=None):
+    """heart.csv as a memory-mapped Arrow table, converted once (again if the CSV changes)."""
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    arrow_path = arrow_path or os.path.splitext(csv_path)[0] + ".arrow"
+
+    if not os.path.exists(arrow_path) or os.path.getmtime(arrow_path) < os.path.getmtime(csv_path):
+        table = pacsv.read_csv(csv_path)
+        tmp = f"{arrow_path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, arrow_path)
+    with pa.memory_map(arrow_path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+# --------------------------------------------------------------------------------
+# 2. HISTORY STORE
+# --------------------------------------------------------------------------------
+
+class HistoryStore:
+    def __init__(self, root=HISTORY_DIR, flush_interval=5.0, max_buffer=10_000,
+                 row_group_size=128 * 1024):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.row_group_size = row_group_size
+        self.schema = _schema()
+        os.makedirs(root, exist_ok=True)
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------------------------------------------
+    # Writes
+    # ----------------------------------------------------------------------------
+
+    def append(self, records):
+        """Queue scored records (dicts with the schema's column names); returns the count."""
+        now = datetime.now(timezone.utc)
+        rows = []
+        for record in records:
+            row = dict(record, timestamp=record.get("timestamp") or now)
+            for f in _INTEGER_FEATURES:
+                if row.get(f) is not None:
+                    row[f] = int(row[f])
+            rows.append(row)
+        with self._lock:
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.max_buffer
+        if full:
+            self._wakeup.set()
+        return len(rows)
+
+    def flush(self):
+        """Write everything buffered as new part files; returns the number of rows written."""
+        import pyarrow as pa
+
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        table, rows = self._to_table(rows)
+        if not rows:
+            return 0
+        days = [_as_date(r["timestamp"]) for r in rows]
+        pending = sorted(set(days))
+        try:
+            with self._write_lock:
+                while pending:
+                    self._write_part(pending[0], table.filter(pa.array([d == pending[0] for d in days])))
+                    pending.pop(0)
+        except Exception:
+            # Put back the days that were not written; they go out with the next flush.
+            with self._lock:
+                self._buffer[:0] = [r for r, d in zip(rows, days) if d in pending]
+            raise
+        return len(rows)
+
+    def _to_table(self, rows):
+        """Arrow table of the rows that fit the schema; the others go to the rejected file."""
+        import pyarrow as pa
+
+        try:
+            return pa.Table.from_pylist(rows, schema=self.schema), rows
+        except (pa.ArrowException, TypeError, ValueError, OverflowError):
+            pass
+        # One bad value fails the whole batch: convert row by row to find it.
+        good, rejected = [], []
+        for row in rows:
+            try:
+                pa.Table.from_pylist([row], schema=self.schema)
+                good.append(row)
+            except (pa.ArrowException, TypeError, ValueError, OverflowError) as e:
+                rejected.append(dict(row, error=str(e)))
+        print(f"History Error: {len(rejected)} row(s) do not fit the schema, see {self.rejected_path}")
+        try:
+            with open(self.rejected_path, "a") as f:
+                for row in rejected:
+                    f.write(json.dumps(row, default=str) + "\n")
+        except OSError as e:
+            print(f"History Error (rejected rows): {e}")
+        return (pa.Table.from_pylist(good, schema=self.schema) if good else None), good
+
+    @property
+    def rejected_path(self):
+        return os.path.join(self.root, ".rejected.jsonl")
+
+    def _write_part(self, day, table):
+        import pyarrow.parquet as pq
+
+        partition = os.path.join(self.root, f"date={day.isoformat()}")
+        os.makedirs(partition, exist_ok=True)
+        name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp = os.path.join(partition, f".{name}.tmp")
+        # Sorted columns give tight row-group min/max stats for the doctor/band filters.
+        table = table.sort_by([("doctor_email", "ascending"), ("risk_level", "ascending")])
+        pq.write_table(table, tmp, row_group_size=self.row_group_size, compression="zstd")
+        os.replace(tmp, os.path.join(partition, name))
+
+    def compact(self, day=None):
+        """Merge each day's part files (or just `day`'s) into one; returns partitions compacted."""
+        import pyarrow.parquet as pq
+
+        compacted = 0
+        with self._write_lock:
+            for partition in sorted(os.listdir(self.root)):
+                if not partition.startswith("date=") or (day and partition != f"date={_as_date(day)}"):
+                    continue
+                path = os.path.join(self.root, partition)
+                parts = sorted(f for f in os.listdir(path) if f.endswith(".parquet"))
+                if len(parts) < 2:
+                    continue
+                table = pq.read_table([os.path.join(path, p) for p in parts], schema=self.schema)
+                self._write_part(_as_date(partition[5:]), table)
+                for p in parts:
+                    os.remove(os.path.join(path, p))
+                compacted += 1
+        return compacted
+
+    # ----------------------------------------------------------------------------
+    # Reads
+    # ----------------------------------------------------------------------------
+
+    def dataset(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        partitioning = ds.partitioning(pa.schema([("date", pa.date32())]), flavor="hive")
+        return ds.dataset(self.root, format="parquet", schema=self.schema.append(pa.field("date", pa.date32())),
+                          partitioning=partitioning, filesystem=fs.LocalFileSystem(use_mmap=True),
+                          exclude_invalid_files=False, ignore_prefixes=["."])
+
+    def filter_expression(self, start=None, end=None, doctor=None, band=None):
+        import pyarrow.dataset as ds
+
+        conditions = []
+        if start is not None:
+            conditions.append(ds.field("date") >= _as_date(start))
+        if end is not None:
+            conditions.append(ds.field("date") <= _as_date(end))
+        if doctor is not None:
+            conditions.append(ds.field("doctor_email") == doctor)
+        if band is not None:
+            bands = [band] if isinstance(band, str) else list(band)
+            conditions.append(ds.field("risk_level").isin(bands))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def scan(self, start=None, end=None, doctor=None, band=None, columns=None):
+        """Arrow table of the matching history rows (dates are inclusive, "YYYY-MM-DD" or date)."""
+        return self.dataset().to_table(
+            columns=columns, filter=self.filter_expression(start, end, doctor, band),
+        )
+
+    def count(self, start=None, end=None, doctor=None, band=None):
+        return self.dataset().count_rows(filter=self.filter_expression(start, end, doctor, band))
+
+    # ----------------------------------------------------------------------------
+    # Background flushing
+    # ----------------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+        return self
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"History Error: {e}")
@@ -0,0 +1,402 @@
+"""Versioned model registry with background reload and shadow scoring.
+
+Layout (train.py writes the version directories):
+
+    Model_datasets/models/
+        20261016-120000-1a2b3c4d/model.pickle   manifest.json holds its sha256
+        LIVE        name of the version to serve
+        CANDIDATE   optional version scored in the shadow of LIVE
+
+Without a LIVE file the app keeps serving Model_datasets/final_model.pickle,
+versioned by its fingerprint as before.
+
+`ModelRegistry.start()` polls the two pointer files (and the fallback
+pickle). A new version is checksum-verified, compiled and warmed up on the
+watcher thread, then swapped in with a single reference assignment. Callers
+resolve the model once per request (`registry.live`, `registry.model(version)`),
+so requests already in flight finish on the model they started with and no
+Streamlit process has to restart.
+
+While a CANDIDATE is set, every batch the live model scores is re-scored by
+the candidate on a background thread; `shadow_report()` compares their
+latency and outputs.
+
+    python model_registry.py list
+    python model_registry.py promote 20261016-120000-1a2b3c4d
+    python model_registry.py shadow 20261016-120000-1a2b3c4d     # --clear to stop
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from heart_model import MODEL_PATH, WARM_UP_ROWS, model_fingerprint, risk_levels
+from shared_model import attach_or_load
+from telemetry import REGISTRY, span
+
+MODELS_DIR = "Model_datasets/models"
+LIVE_POINTER = "LIVE"
+CANDIDATE_POINTER = "CANDIDATE"
+
+REGISTRY.describe("heart_model_latency_seconds", "predict_proba time per batch by role (live/shadow).")
+REGISTRY.describe("heart_model_swaps_total", "Model versions swapped in without a restart.")
+
+# --------------------------------------------------------------------------------
+# 1. ARTIFACTS AND POINTERS
+# --------------------------------------------------------------------------------
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify_artifact(version, models_dir=MODELS_DIR):
+    """Manifest of `version` after checking model.pickle against its sha256; raises ValueError."""
+    directory = os.path.join(models_dir, version)
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"{version}: unreadable manifest ({e})")
+    pickle_path = os.path.join(directory, "model.pickle")
+    if not os.path.exists(pickle_path):
+        raise ValueError(f"{version}: model.pickle missing")
+    if _sha256(pickle_path) != manifest.get("sha256"):
+        raise ValueError(f"{version}: model.pickle does not match the manifest checksum")
+    return manifest
+
+
+def list_versions(models_dir=MODELS_DIR):
+    """Version directory names (oldest first)."""
+    if not os.path.isdir(models_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(models_dir)
+        if os.path.exists(os.path.join(models_dir, name, "manifest.json"))
+    )
+
+
+def read_pointer(name, models_dir=MODELS_DIR):
+    try:
+        with open(os.path.join(models_dir, name)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(name, version, models_dir=MODELS_DIR):
+    """Point LIVE/CANDIDATE at `version` (verified first); None removes the pointer."""
+    path = os.path.join(models_dir, name)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    verify_artifact(version, models_dir)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, path)
+
+
+def promote(version, models_dir=MODELS_DIR):
+    write_pointer(LIVE_POINTER, version, models_dir)
+    if read_pointer(CANDIDATE_POINTER, models_dir) == version:
+        write_pointer(CANDIDATE_POINTER, None, models_dir)
+
+# --------------------------------------------------------------------------------
+# 2. LOADED VERSIONS
+# --------------------------------------------------------------------------------
+
+class LoadedModel:
+    """One servable version: the compiled ensemble plus where it came from."""
+
+    def __init__(self, version, path, model, manifest=None):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.manifest = manifest or {}
+        self.loaded_at = time.time()
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+
+def load_version(version=None, models_dir=MODELS_DIR, fallback_path=MODEL_PATH):
+    """Verify, compile and warm up `version` (None = the fallback pickle)."""
+    with span("load_model_version", version=version or "fallback"):
+        if version is None:
+            path, manifest = fallback_path, None
+            version = model_fingerprint(path)
+        else:
+            manifest = verify_artifact(version, models_dir)
+            path = os.path.join(models_dir, version, "model.pickle")
+        # Read-only arrays shared with the other processes on this host (shared_model.py)
+        model = attach_or_load(path)
+        for row in WARM_UP_ROWS:
+            model.predict_proba([row])
+        model.predict_proba(WARM_UP_ROWS)
+        return LoadedModel(version, path, model, manifest)
+
+# --------------------------------------------------------------------------------
+# 3. REGISTRY
+# --------------------------------------------------------------------------------
+
+class ModelRegistry:
+    def __init__(self, models_dir=MODELS_DIR, fallback_path=MODEL_PATH, poll_interval=2.0,
+                 shadow_queue=256):
+        self.models_dir = models_dir
+        self.fallback_path = fallback_path
+        self.poll_interval = poll_interval
+        self.live = None
+        self.candidate = None
+        self._loaded = {}        # live, candidate and the previously live version
+        self._state = None       # pointer/fallback state last applied
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._shadow_queue = queue.Queue(maxsize=shadow_queue)
+        self._shadow_thread = None
+        self._shadow = self._empty_shadow()
+
+    # ----------------------------------------------------------------------------
+    # Loading and swapping
+    # ----------------------------------------------------------------------------
+
+    def _current_state(self):
+        live = read_pointer(LIVE_POINTER, self.models_dir)
+        candidate = read_pointer(CANDIDATE_POINTER, self.models_dir)
+        fallback = None
+        if live is None:
+            st = os.stat(self.fallback_path)
+            fallback = (st.st_mtime_ns, st.st_size)
+        return live, candidate, fallback
+
+    def _get_or_load(self, version):
+        with self._lock:
+            cached = self._loaded.get(version or model_fingerprint(self.fallback_path))
+        return cached or load_version(version, self.models_dir, self.fallback_path)
+
+    def refresh(self):
+        """Load and swap in whatever LIVE/CANDIDATE point to now; True if anything changed."""
+        state = self._current_state()
+        if state == self._state:
+            return False
+        live_version, candidate_version, _ = state
+        complete = True
+        try:
+            live = self._get_or_load(live_version)
+        except Exception as e:
+            print(f"Model Registry Error: cannot serve {live_version} ({e})")
+            live = self.live or self._get_or_load(None)
+            complete = False
+        candidate = None
+        if candidate_version and candidate_version != live.version:
+            try:
+                candidate = self._get_or_load(candidate_version)
+            except Exception as e:
+                print(f"Model Registry Error: cannot shadow {candidate_version} ({e})")
+                complete = False
+
+        with self._lock:
+            previous = self.live
+            # The swap itself: requests that already took the old object keep using it.
+            self.live, self.candidate = live, candidate
+            self._loaded = {m.version: m for m in (previous, candidate, live) if m is not None}
+            # A version that failed to load (e.g. read mid-deploy) is retried on the next refresh.
+            self._state = state if complete else None
+            if candidate is not None and self._shadow["candidate"] != candidate.version:
+                self._shadow = self._empty_shadow(live.version, candidate.version)
+        if previous is None or previous.version != live.version:
+            if previous is not None:
+                REGISTRY.inc("heart_model_swaps_total")
+            print(f"Model Registry: serving {live.version}")
+        return True
+
+    def model(self, version=None):
+        """The loaded model for `version` (default: live); loads it if it is not in memory.
+
+        Raises ValueError if `version` can no longer be loaded (e.g. a replaced
+        fallback pickle): a request is never answered by a different version.
+        """
+        if self.live is None:
+            self.refresh()
+        if version is None:
+            return self.live
+        with self._lock:
+            cached = self._loaded.get(version)
+        if cached is not None:
+            return cached
+        if os.path.isdir(os.path.join(self.models_dir, version)):
+            loaded = load_version(version, self.models_dir, self.fallback_path)
+        elif version == model_fingerprint(self.fallback_path):
+            loaded = load_version(None, self.models_dir, self.fallback_path)
+        else:
+            raise ValueError(f"model version {version} is no longer available")
+        with self._lock:
+            # Kept until the next swap rebuilds _loaded
+            self._loaded.setdefault(version, loaded)
+        return loaded
+
+    # ----------------------------------------------------------------------------
+    # Scoring
+    # ----------------------------------------------------------------------------
+
+    def predict_proba(self, X, version=None):
+        """Score with `version` (default: live), timed and shadowed by the candidate."""
+        live = self.model(version)
+        start = time.perf_counter()
+        proba = live.predict_proba(X)
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe("heart_model_latency_seconds", elapsed, role="live")
+        candidate = self.candidate
+        if candidate is not None and candidate.version != live.version:
+            try:
+                self._shadow_queue.put_nowait((live.version, candidate, X, proba, elapsed))
+            except queue.Full:
+                with self._lock:
+                    self._shadow["dropped"] += 1
+        return proba
+
+    def _empty_shadow(self, live=None, candidate=None):
+        return {"live": live, "candidate": candidate, "batches": 0, "rows": 0, "dropped": 0,
+                "abs_diff_sum": 0.0, "max_abs_diff": 0.0, "band_disagreements": 0,
+                "live_seconds": 0.0, "candidate_seconds": 0.0}
+
+    def _run_shadow(self):
+        while not self._stopping.is_set():
+            item = self._shadow_queue.get()
+            if item is None:
+                continue
+            live_version, candidate, X, live_proba, live_elapsed = item
+            try:
+                start = time.perf_counter()
+                proba = candidate.predict_proba(X)
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                print(f"Model Registry Error: shadow scoring failed ({e})")
+                continue
+            REGISTRY.observe("heart_model_latency_seconds", elapsed, role="shadow")
+            live_p, candidate_p = np.asarray(live_proba)[:, 1], np.asarray(proba)[:, 1]
+            diff = np.abs(candidate_p - live_p)
+            disagreements = int(np.sum(risk_levels(live_p * 100) != risk_levels(candidate_p * 100)))
+            with self._lock:
+                shadow = self._shadow
+                if shadow["candidate"] != candidate.version or shadow["live"] != live_version:
+                    continue  # a swap happened since this batch was scored
+                shadow["batches"] += 1
+                shadow["rows"] += len(diff)
+                shadow["abs_diff_sum"] += float(diff.sum())
+                shadow["max_abs_diff"] = max(shadow["max_abs_diff"], float(diff.max(initial=0.0)))
+                shadow["band_disagreements"] += disagreements
+                shadow["live_seconds"] += live_elapsed
+                shadow["candidate_seconds"] += elapsed
+
+    def shadow_report(self):
+        """Live vs. candidate since the candidate was set (None when there is no candidate)."""
+        with self._lock:
+            shadow = dict(self._shadow)
+        if self.candidate is None or shadow["candidate"] is None:
+            return None
+        batches, rows = shadow["batches"], shadow["rows"]
+        return {
+            "live": shadow["live"],
+            "candidate": shadow["candidate"],
+            "batches": batches,
+            "rows": rows,
+            "dropped": shadow["dropped"],
+            "mean_abs_diff": shadow["abs_diff_sum"] / rows if rows else None,
+            "max_abs_diff": shadow["max_abs_diff"],
+            "band_agreement": 1 - shadow["band_disagreements"] / rows if rows else None,
+            "live_ms_per_batch": 1000 * shadow["live_seconds"] / batches if batches else None,
+            "candidate_ms_per_batch": 1000 * shadow["candidate_seconds"] / batches if batches else None,
+        }
+
+    def register_metrics(self, registry=REGISTRY):
+        """Expose the shadow comparison as gauges (absent while no candidate is set)."""
+        registry.describe("heart_shadow_mean_abs_diff", "Mean |candidate - live| probability.")
+        registry.describe("heart_shadow_band_agreement", "Share of rows where candidate and live agree on the band.")
+        registry.gauge("heart_shadow_mean_abs_diff", lambda: self.shadow_report()["mean_abs_diff"])
+        registry.gauge("heart_shadow_band_agreement", lambda: self.shadow_report()["band_agreement"])
+        registry.gauge("heart_shadow_dropped_batches", lambda: self.shadow_report()["dropped"])
+        return self
+
+    # ----------------------------------------------------------------------------
+    # Watcher
+    # ----------------------------------------------------------------------------
+
+    def start(self):
+        if self.live is None:
+            self.refresh()
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+            self._thread.start()
+            self._shadow_thread = threading.Thread(target=self._run_shadow, name="model-shadow", daemon=True)
+            self._shadow_thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._shadow_queue.put(None)
+        for thread in (self._thread, self._shadow_thread):
+            if thread is not None:
+                thread.join(timeout)
+
+    def _watch(self):
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Model Registry Error: {e}")
+
+# --------------------------------------------------------------------------------
+# 4. CLI
+# --------------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry.")
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="registry directory (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show versions, checksums and pointers")
+    promote_cmd = commands.add_parser("promote", help="serve a version (running apps swap it in)")
+    promote_cmd.add_argument("version")
+    shadow_cmd = commands.add_parser("shadow", help="score a candidate next to the live version")
+    shadow_cmd.add_argument("version", nargs="?")
+    shadow_cmd.add_argument("--clear", action="store_true", help="stop shadow scoring")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        live = read_pointer(LIVE_POINTER, args.models_dir)
+        candidate = read_pointer(CANDIDATE_POINTER, args.models_dir)
+        if live is None:
+            print(f"LIVE not set: serving {MODEL_PATH}")
+        for version in list_versions(args.models_dir):
+            try:
+                manifest = verify_artifact(version, args.models_dir)
+                accuracy = manifest.get("metrics", {}).get("accuracy")
+                status = f"ok  accuracy={accuracy:.4f}" if accuracy is not None else "ok"
+            except ValueError as e:
+                status = f"INVALID ({e})"
+            marker = "LIVE" if version == live else "CANDIDATE" if version == candidate else ""
+            print(f"{version:<28}{marker:<11}{status}")
+    elif args.command == "promote":
+        promote(args.version, args.models_dir)
+        print(f"LIVE -> {args.version}")
+    elif args.command == "shadow":
+        if not args.clear and not args.version:
+            parser.error("shadow needs a version or --clear")
+        write_pointer(CANDIDATE_POINTER, None if args.clear else args.version, args.models_dir)
+        print("CANDIDATE cleared" if args.clear else f"CANDIDATE -> {args.version}")
+
+
+if __name__ == "__main__":
+    main()
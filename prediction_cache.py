@@ -0,0 +1,88 @@
+"""Bounded LRU + TTL memoization of model predictions.
+
+Keys are the canonicalized 13-feature input vector plus the model version
+(see `heart_model.model_fingerprint`). When a lookup arrives with a
+different model version the whole cache is dropped, so a replaced
+`final_model.pickle` never serves stale probabilities.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def canonical_key(features):
+    # Sliders give ints and oldpeak a float; 1 and 1.0 must hit the same entry.
+    return tuple(round(float(x), 4) for x in features)
+
+
+class PredictionCache:
+    def __init__(self, maxsize=10_000, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, features, version):
+        key = canonical_key(features)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored = entry
+                if time.monotonic() - stored <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, features, version, value):
+        key = canonical_key(features)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, features, version, compute):
+        value = self.get(features, version)
+        if value is None:
+            value = compute()
+            self.put(features, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "model_version": self._version,
+            }
@@ -0,0 +1,353 @@
+"""Formatted patient reports (HTML, optionally PDF) for single emails and whole rosters.
+
+The templates are `string.Template`s compiled once at import, so rendering a
+report is a handful of `substitute` calls. The header image from Media/ is
+downscaled once, cached in memory and under .cache/report_assets/, and
+inlined: as a `cid:` part of the email, or as a data: URI in standalone
+HTML/PDF. Roster emails (`build_messages`) do not carry the image: they link
+HEART_REPORT_HEADER_URL when it is set and leave the header out otherwise.
+
+    report = patient_report("Jane Doe", user_input, 42.0, drivers=top_drivers(contributions[0]))
+    msg = build_message(sender, "doctor@example.com", report)
+    outbox.enqueue_many(build_messages(sender, recipients, reports, workers=4))
+
+`render_batch` / `build_messages` render large rosters in a process pool.
+PDF attachments need the optional `weasyprint` package.
+"""
+import base64
+import html
+import math
+import os
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from string import Template
+
+from heart_model import FEATURES, risk_level
+
+ASSET_CACHE_DIR = ".cache/report_assets"
+HEADER_IMAGE = "Media/info1.jpg"
+HEADER_CID = "report-header"
+HEADER_URL = os.environ.get("HEART_REPORT_HEADER_URL")
+ASSET_WIDTH = 600
+SUBJECT = "❤️ Your Heart Attack Risk Prediction Result"
+
+# Batches smaller than this are rendered in-process; a pool only pays off for big rosters or PDFs.
+_MIN_POOL_REPORTS = 2000
+
+# Short form of the app_one glossary, one line per form field
+GLOSSARY = {
+    "age": "Age is one of the strongest risk factors; risk generally rises after 45 in men and 55 in women.",
+    "sex": "Men tend to develop heart disease earlier; risk rises significantly for women after menopause.",
+    "cp": "Type of chest discomfort: typical angina is pressure-like and triggered by effort, "
+          "non-anginal pain is unlikely to be heart related.",
+    "trtbps": "Pressure in the arteries between beats; values above 140/90 mm Hg increase heart strain.",
+    "chol": "Total blood cholesterol; high levels can lead to plaque buildup in the arteries.",
+    "fbs": "Blood sugar above 120 mg/dl after 8 hours without food is a marker of (pre-)diabetes.",
+    "restecg": "Electrocardiogram at rest: ST-T changes may indicate ischemia, hypertrophy a thickened heart muscle.",
+    "thalachh": "Highest heart rate reached in an exercise test; lower than expected for the age may indicate heart problems.",
+    "exng": "Chest pain that appears or worsens during physical activity.",
+    "oldpeak": "How far the ST segment drops during exercise; drops above 1-2 mm suggest reduced blood flow.",
+    "slp": "ST segment shape at peak exercise: upsloping is usually normal, flat or downsloping is concerning.",
+    "caa": "Number of main coronary arteries clearly visible on imaging; fewer often means more blockages.",
+    "thall": "Nuclear imaging of blood flow: a fixed defect is old damage, a reversible defect active ischemia.",
+}
+
+UNITS = {"age": "years", "trtbps": "mm Hg", "chol": "mg/dl", "thalachh": "bpm", "oldpeak": "mm"}
+
+BAND_COLORS = {"low": "#2e7d32", "moderate": "#ef6c00", "high": "#c62828"}
+
+# --------------------------------------------------------------------------------
+# 1. TEMPLATES
+# --------------------------------------------------------------------------------
+
+REPORT_TEMPLATE = Template("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Heart risk report - $patient</title></head>
+<body style="margin:0;background:#f4f4f7;font-family:Arial,Helvetica,sans-serif;color:#0b0b45">
+<table role="presentation" width="100%" cellpadding="0" cellspacing="0"><tr><td align="center">
+<table role="presentation" width="600" cellpadding="0" cellspacing="0" style="background:#ffffff;margin:16px 0">
+$header
+<tr><td style="padding:24px">
+<h2 style="margin:0 0 4px">Heart Disease Risk Report</h2>
+<p style="margin:0;color:#555">Patient: <b>$patient</b> &middot; $created</p>
+<div style="margin:20px 0;padding:16px;border-left:6px solid $band_color;background:#fafafa">
+<div style="font-size:13px;color:#555">Estimated heart disease risk</div>
+<div style="font-size:36px;font-weight:bold;color:$band_color">$risk_pct%</div>
+<div style="font-weight:bold;color:$band_color">$band_label risk</div>
+</div>
+$drivers
+<h3 style="margin:24px 0 8px">Vitals and test results</h3>
+<table width="100%" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-size:14px">
+$vitals
+</table>
+<h3 style="margin:24px 0 8px">Glossary</h3>
+<dl style="font-size:13px;margin:0">
+$glossary
+</dl>
+<p style="margin-top:24px;font-size:12px;color:#777">DISCLAIMER: This is an AI-powered tool for informational
+purposes only. It is not a diagnosis and not a substitute for professional medical advice.$footer</p>
+</td></tr></table>
+</td></tr></table>
+</body></html>
+""")
+
+HEADER_ROW = Template('<tr><td><img src="$src" width="600" alt="Heart Attack Prediction App" '
+                      'style="display:block;width:100%"></td></tr>')
+VITAL_ROW = Template('<tr style="border-bottom:1px solid #eee"><td>$title</td><td align="right"><b>$value</b></td></tr>')
+GLOSSARY_ENTRY = Template('<dt style="font-weight:bold;margin-top:8px">$title</dt><dd style="margin:0">$text</dd>')
+DRIVER_ITEM = Template("<li>$title: <b>$value</b> $direction risk (odds $factor)</li>")
+DRIVERS_BLOCK = Template('<h3 style="margin:24px 0 8px">Top drivers of this prediction</h3><ul style="font-size:14px">$items</ul>')
+
+TEXT_TEMPLATE = Template("""Hello,
+
+Thank you for using the Heart Attack Prediction App!
+
+Report for $patient ($created):
+Estimated heart disease risk: $risk_pct% ($band_label risk)
+
+$vitals
+
+DISCLAIMER: This is an AI-powered tool for informational purposes only.
+It is not a substitute for professional medical advice.
+
+Stay healthy!
+
+--
+Heart Attack Prediction App
+""")
+
+# --------------------------------------------------------------------------------
+# 2. REPORT DATA
+# --------------------------------------------------------------------------------
+
+def patient_report(patient_name, features, risk_pct, drivers=None, doctor=None, model_version=None,
+                   created=None):
+    """Everything a report shows, as plain picklable data (features in FEATURES order)."""
+    values = [float(v) for v in features]
+    return {
+        "patient": str(patient_name or "Patient"),
+        "features": dict(zip(FEATURES, values)),
+        "risk_pct": float(risk_pct),
+        "risk_level": risk_level(risk_pct),
+        "drivers": [(name, float(v)) for name, v in (drivers or [])],
+        "doctor": doctor,
+        "model_version": model_version,
+        "created": created or datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
+
+
+def _vital_rows(features):
+    from sensitivity import FEATURE_TITLES, value_labels
+
+    for name in FEATURES:
+        value = value_labels(name, [features[name]])[0]
+        unit = UNITS.get(name)
+        yield FEATURE_TITLES[name], f"{value} {unit}" if unit and not isinstance(value, str) else str(value)
+
+# --------------------------------------------------------------------------------
+# 3. STATIC ASSETS
+# --------------------------------------------------------------------------------
+
+@lru_cache(maxsize=8)
+def load_asset(path, width=ASSET_WIDTH):
+    """JPEG bytes of an image under Media/ scaled to `width`, built once and cached on disk."""
+    stamp = os.stat(path).st_mtime_ns
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cached = os.path.join(ASSET_CACHE_DIR, f"{stem}-{width}-{stamp}.jpg")
+    if os.path.exists(cached):
+        with open(cached, "rb") as f:
+            return f.read()
+    try:
+        from io import BytesIO
+
+        from PIL import Image
+    except ImportError:
+        with open(path, "rb") as f:
+            return f.read()
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        image.thumbnail((width, width * 10))
+        out = BytesIO()
+        image.save(out, "JPEG", quality=82, optimize=True)
+    data = out.getvalue()
+    try:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, cached)
+    except OSError as e:
+        print(f"Report Asset Error ({cached}): {e}")
+    return data
+
+
+@lru_cache(maxsize=8)
+def _data_uri(path):
+    return "data:image/jpeg;base64," + base64.b64encode(load_asset(path)).decode()
+
+
+@lru_cache(maxsize=8)
+def _image_part(path, cid):
+    from email.mime.image import MIMEImage
+
+    # Encoded once and attached to every message (the generator only reads it).
+    part = MIMEImage(load_asset(path), "jpeg")
+    part.add_header("Content-ID", f"<{cid}>")
+    part.add_header("Content-Disposition", "inline", filename=os.path.basename(path))
+    return part
+
+# --------------------------------------------------------------------------------
+# 4. RENDERING
+# --------------------------------------------------------------------------------
+
+def _header_row(inline):
+    if inline == "cid":
+        return HEADER_ROW.substitute(src=f"cid:{HEADER_CID}")
+    if inline == "data":
+        return HEADER_ROW.substitute(src=_data_uri(HEADER_IMAGE))
+    return HEADER_ROW.substitute(src=html.escape(HEADER_URL)) if HEADER_URL else ""
+
+
+def render_html(report, inline="cid"):
+    """The report as HTML; `inline="cid"` for emails, `"data"` for standalone files and PDFs.
+
+    `inline="link"` links HEADER_URL instead of inlining the image (no header when it is unset).
+    """
+    from sensitivity import FEATURE_TITLES, value_labels
+
+    esc = html.escape
+    features = report["features"]
+    vitals = "\n".join(VITAL_ROW.substitute(title=esc(t), value=esc(v)) for t, v in _vital_rows(features))
+    glossary = "\n".join(
+        GLOSSARY_ENTRY.substitute(title=esc(FEATURE_TITLES[name]), text=esc(GLOSSARY[name])) for name in FEATURES
+    )
+    drivers = ""
+    if report["drivers"]:
+        items = "".join(
+            DRIVER_ITEM.substitute(
+                title=esc(FEATURE_TITLES[name]), value=esc(str(value_labels(name, [features[name]])[0])),
+                direction="raises" if value > 0 else "lowers",
+                factor=f"&times;{math.exp(value):.1f}" if value > 0 else f"&divide;{math.exp(-value):.1f}",
+            )
+            for name, value in report["drivers"]
+        )
+        drivers = DRIVERS_BLOCK.substitute(items=items)
+    footer = ""
+    if report.get("doctor"):
+        footer += f"<br>Requested by {esc(report['doctor'])}."
+    if report.get("model_version"):
+        footer += f"<br>Model version {esc(report['model_version'])}."
+    level = report["risk_level"]
+    return REPORT_TEMPLATE.substitute(
+        patient=esc(report["patient"]), created=esc(report["created"]),
+        header=_header_row(inline),
+        risk_pct=f"{report['risk_pct']:.1f}", band_label=level.capitalize(), band_color=BAND_COLORS[level],
+        drivers=drivers, vitals=vitals, glossary=glossary, footer=footer,
+    )
+
+
+def render_text(report):
+    vitals = "\n".join(f"  {title}: {value}" for title, value in _vital_rows(report["features"]))
+    return TEXT_TEMPLATE.substitute(
+        patient=report["patient"], created=report["created"], risk_pct=f"{report['risk_pct']:.1f}",
+        band_label=report["risk_level"].capitalize(), vitals=vitals,
+    )
+
+
+def render_pdf(report):
+    """PDF bytes of the report; raises ImportError without the optional weasyprint package."""
+    from weasyprint import HTML
+
+    return HTML(string=render_html(report, inline="data")).write_pdf()
+
+
+def _render_one(args):
+    report, pdf, inline = args
+    pdf_bytes = None
+    if pdf:
+        try:
+            pdf_bytes = render_pdf(report)
+        except ImportError:
+            pass
+    return render_html(report, inline), pdf_bytes
+
+
+def render_batch(reports, workers=1, pdf=False, inline="cid"):
+    """[(html, pdf bytes or None)] for every report, in order; a process pool when `workers` > 1."""
+    jobs = [(report, pdf, inline) for report in reports]
+    if workers <= 1 or (len(jobs) < _MIN_POOL_REPORTS and not pdf):
+        return [_render_one(job) for job in jobs]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_render_one, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+# --------------------------------------------------------------------------------
+# 5. EMAIL MESSAGES
+# --------------------------------------------------------------------------------
+
+def recipient_address(value):
+    """The bare address in `value` ("Jane <jane@example.com>" or "jane@example.com"), or None.
+
+    Only a single, plain address is accepted: header injection (line breaks)
+    and lists of addresses are rejected.
+    """
+    from email.utils import parseaddr
+
+    if not isinstance(value, str) or any(c in value for c in "\r\n,;"):
+        return None
+    _, address = parseaddr(value.strip())
+    local, at, domain = address.rpartition("@")
+    if not (local and at and "." in domain) or any(c.isspace() for c in address):
+        return None
+    return address
+
+
+def build_message(sender, recipient, report, html_body=None, pdf=None, text=None, subject=SUBJECT,
+                  inline="cid"):
+    """multipart/mixed: (plain text | HTML with the header image) [+ PDF attachment].
+
+    With `inline="cid"` the image travels with the message; `"link"` renders
+    the HTML without it (see `render_html`), for large batches.
+    """
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    # Fixed random boundaries spare the generator a regex scan of every body for collisions.
+    boundary = f"=={uuid.uuid4().hex}"
+    msg = MIMEMultipart("mixed", boundary=boundary + "m")
+    msg["From"] = f"Heart Attack App <{sender}>"
+    msg["To"] = recipient
+    msg["Subject"] = subject
+
+    alternative = MIMEMultipart("alternative", boundary=boundary + "a")
+    alternative.attach(MIMEText(text or render_text(report), "plain", "utf-8"))
+    alternative.attach(MIMEText(html_body or render_html(report, inline), "html", "utf-8"))
+    if inline == "cid":
+        related = MIMEMultipart("related", boundary=boundary + "r")
+        related.attach(alternative)
+        related.attach(_image_part(HEADER_IMAGE, HEADER_CID))
+        msg.attach(related)
+    else:
+        msg.attach(alternative)
+
+    if pdf:
+        attachment = MIMEApplication(pdf, "pdf")
+        name = "".join(c if c.isalnum() else "_" for c in report["patient"]).strip("_") or "patient"
+        attachment.add_header("Content-Disposition", "attachment", filename=f"heart_report_{name}.pdf")
+        msg.attach(attachment)
+    return msg
+
+
+def build_messages(sender, recipients, reports, workers=1, pdf=False, inline="link"):
+    """One message per (recipient, report) pair, built lazily; the rendering runs in `render_batch`.
+
+    The header image is linked rather than inlined by default: a roster would
+    otherwise store one copy of it per message in the outbox.
+    """
+    rendered = render_batch(reports, workers=workers, pdf=pdf, inline=inline)
+    return (
+        build_message(sender, recipient, report, html_body=html_body, pdf=pdf_bytes, inline=inline)
+        for recipient, report, (html_body, pdf_bytes) in zip(recipients, reports, rendered)
+    )
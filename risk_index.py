@@ -0,0 +1,408 @@
+"""Precomputed risk lookup table over the form's input domain.
+
+A tree ensemble is piecewise constant: its output only changes where an input
+crosses one of the model's split thresholds. `build_risk_index` cuts every
+feature's range (heart_model.FEATURE_RANGES) at those thresholds, evaluates
+the model once per cell and stores the probabilities as a memory-mapped
+.npy table, so a lookup is a few `searchsorted` calls and one array read.
+
+When the full grid has more than `max_cells` cells, the cut points that
+split the least training weight are dropped, so a cell may span several
+model regions. For every cell the build also bounds the model over the whole
+cell: each tree's smallest and largest leaf reachable from the cell are
+summed. A cell is exact when the bounds meet, and its band is certain when
+both bounds fall in the same band. `risk_bands` and `band_one` answer from
+the table wherever the band is certain and use the live model only for the
+other cells; `predict_proba(exact=True)` does the same for inexact cells.
+
+    python risk_index.py                  # build for final_model.pickle and print the error report
+    python risk_index.py --max-cells 500000 --samples 200000
+"""
+import argparse
+import json
+import os
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from heart_model import (
+    CONTINUOUS_FEATURES, DATASET_PATH, FEATURE_RANGES, FEATURES, LOW_RISK_MAX,
+    MODEL_PATH, MODERATE_RISK_MAX, model_fingerprint, risk_levels,
+)
+
+INDEX_DIR = ".cache/risk_index"
+INDEX_FORMAT = 2
+MAX_CELLS = 2_000_000
+UNCERTAIN = -1
+_BAND_NAMES = np.array(["low", "moderate", "high"], dtype=object)
+
+# --------------------------------------------------------------------------------
+# 1. AXES
+# --------------------------------------------------------------------------------
+
+def _axis(model, column, name):
+    """Cut points of one feature inside its form range and the training weight each one splits.
+
+    A cell is searchsorted(edges, x); the weight is the summed cover of the
+    nodes that split at that cut, used to decide which cuts to keep.
+    """
+    lo, hi = FEATURE_RANGES[name]
+    internal = (model.feature == column) & np.isfinite(model.threshold)
+    thresholds = model.threshold[internal]
+    cover = model.cover[internal] if model.cover is not None else np.ones(len(thresholds))
+    inside = (thresholds >= lo) & (thresholds < hi)
+    thresholds, cover = thresholds[inside], cover[inside]
+    if name not in CONTINUOUS_FEATURES:
+        # Integer inputs: x <= t is the same as x <= floor(t), so one cut per integer gap.
+        thresholds = np.floor(thresholds) + 0.5
+    edges, cut = np.unique(thresholds, return_inverse=True)
+    return edges, np.bincount(cut, weights=cover, minlength=len(edges))
+
+
+def _coarsen(edges, weights, max_cells):
+    """Keep the heaviest cut points of every axis so the grid has at most `max_cells` cells.
+
+    Each step drops the cut that loses the least split weight per cell saved.
+    """
+    order = [np.argsort(-w, kind="stable") for w in weights]
+    keep = [len(e) for e in edges]
+    while np.prod([k + 1 for k in keep], dtype=float) > max_cells:
+        costs = [w[o[k - 1]] / np.log((k + 1) / k) if k else np.inf for w, o, k in zip(weights, order, keep)]
+        keep[int(np.argmin(costs))] -= 1
+    return [np.sort(e[o[:k]]) for e, o, k in zip(edges, order, keep)]
+
+
+def _cell_limits(edges, name):
+    """Smallest and largest input value of every cell of one axis (cell i is edges[i-1] < x <= edges[i])."""
+    lo, hi = FEATURE_RANGES[name]
+    if name in CONTINUOUS_FEATURES:
+        lower = np.nextafter(edges, np.inf)
+    else:
+        lower, edges = np.floor(edges) + 1, np.floor(edges)
+    return np.concatenate([[lo], lower]), np.concatenate([edges, [hi]])
+
+
+def _representatives(edges, name):
+    """One in-range input value per cell."""
+    lo, hi = FEATURE_RANGES[name]
+    if name in CONTINUOUS_FEATURES:
+        return (np.concatenate([[lo], edges]) + np.concatenate([edges, [hi]])) / 2
+    lower = np.concatenate([[lo], np.floor(edges) + 1])
+    upper = np.concatenate([np.floor(edges), [hi]])
+    return np.floor((lower + upper) / 2)
+
+
+def _tree_bounds(model, root, limits):
+    """Smallest and largest leaf of one tree over every cell of the features it splits on.
+
+    Returns those features (sorted) and the two value tables, one axis per feature.
+    """
+    used, stack = set(), [root]
+    while stack:
+        node = stack.pop()
+        if model.left[node] != node:
+            used.add(int(model.feature[node]))
+            stack += [model.left[node], model.right[node]]
+    used = tuple(sorted(used))
+    shape = tuple(len(limits[f][0]) for f in used)
+    # Per-feature cell limits shaped to broadcast over the tree's own sub-grid
+    lower, upper = {}, {}
+    for axis, f in enumerate(used):
+        view = [1] * len(used)
+        view[axis] = -1
+        lower[f], upper[f] = limits[f][0].reshape(view), limits[f][1].reshape(view)
+
+    def walk(node):
+        if model.left[node] == node:
+            return model.value[node], model.value[node]
+        f, t = model.feature[node], model.threshold[node]
+        left_lo, left_hi = walk(model.left[node])
+        right_lo, right_hi = walk(model.right[node])
+        go_left, go_right = lower[f] <= t, upper[f] > t
+        return (np.minimum(np.where(go_left, left_lo, np.inf), np.where(go_right, right_lo, np.inf)),
+                np.maximum(np.where(go_left, left_hi, -np.inf), np.where(go_right, right_hi, -np.inf)))
+
+    lo, hi = walk(root)
+    return used, np.broadcast_to(lo, shape).copy(), np.broadcast_to(hi, shape).copy()
+
+
+def _ensemble_bounds(model, edges):
+    """Per-tree bounds summed into as few tables as possible, keyed by the features they cover."""
+    limits = [_cell_limits(e, name) for e, name in zip(edges, FEATURES)]
+    groups = {}
+    for root in model.roots:
+        used, lo, hi = _tree_bounds(model, root, limits)
+        if used in groups:
+            groups[used][0] += lo
+            groups[used][1] += hi
+        else:
+            groups[used] = [lo, hi]
+    # Fold every table into one over a superset of its features (broadcasting the missing axes).
+    merged = {}
+    for used in sorted(groups, key=len, reverse=True):
+        lo, hi = groups[used]
+        host = next((k for k in merged if set(used) <= set(k)), None)
+        if host is None:
+            merged[used] = [lo, hi]
+            continue
+        view = [lo.shape[used.index(f)] if f in used else 1 for f in host]
+        merged[host][0] += lo.reshape(view)
+        merged[host][1] += hi.reshape(view)
+    return merged
+
+# --------------------------------------------------------------------------------
+# 2. INDEX
+# --------------------------------------------------------------------------------
+
+class RiskIndex:
+    def __init__(self, table, band, exact, edges, meta):
+        self.table = table            # P(heart disease) per cell, shape = cells per axis
+        self.band = band              # 0/1/2 (low/moderate/high) where certain over the cell, else UNCERTAIN
+        self.exact = exact            # True where the model is constant over the cell
+        self.edges = edges            # list of cut-point arrays in FEATURES order
+        self.meta = meta
+        self._lo = np.array([FEATURE_RANGES[f][0] for f in FEATURES], dtype=float)
+        self._hi = np.array([FEATURE_RANGES[f][1] for f in FEATURES], dtype=float)
+        # Plain-Python copies for the single-row path (no per-call NumPy overhead)
+        self._axes = [(lo, hi, e.tolist(), stride) for lo, hi, e, stride in zip(
+            self._lo.tolist(), self._hi.tolist(), edges,
+            (np.array(self.table.strides) // self.table.itemsize).tolist())]
+        self._flat = self.table.reshape(-1)
+        self._band_flat = self.band.reshape(-1)
+        self._exact_flat = self.exact.reshape(-1)
+
+    @property
+    def model_version(self):
+        return self.meta["model_version"]
+
+    def cells(self, X):
+        """Flat cell index and in-range mask for a feature matrix."""
+        # Match the model: inputs are compared as float32 against the thresholds.
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        in_range = ((X >= self._lo) & (X <= self._hi)).all(axis=1)
+        coords = [np.searchsorted(edges, X[:, column], side="left") for column, edges in enumerate(self.edges)]
+        return np.ravel_multi_index(coords, self.table.shape), in_range
+
+    def _cell_one(self, row):
+        flat = 0
+        for value, (lo, hi, edges, stride) in zip(np.asarray(row, dtype=np.float32).tolist(), self._axes):
+            if not lo <= value <= hi:
+                return None
+            flat += bisect_left(edges, value) * stride
+        return flat
+
+    def lookup_one(self, row):
+        """(probability, exact) for one feature vector; None when it is outside the form ranges."""
+        flat = self._cell_one(row)
+        if flat is None:
+            return None
+        return float(self._flat[flat]), bool(self._exact_flat[flat])
+
+    def band_one(self, row):
+        """Risk band for one feature vector, or None when the live model must decide."""
+        flat = self._cell_one(row)
+        if flat is None:
+            return None
+        band = int(self._band_flat[flat])
+        return None if band == UNCERTAIN else _BAND_NAMES[band]
+
+    def lookup(self, X):
+        """(probabilities, exact mask, in-range mask) straight from the table."""
+        flat, in_range = self.cells(X)
+        proba = np.asarray(self._flat[flat], dtype=np.float64)
+        return proba, np.asarray(self._exact_flat[flat]) & in_range, in_range
+
+    def predict_proba(self, X, exact=False, model=None):
+        """P(heart disease) per row; `exact=True` rescores inexact or out-of-range rows with `model`."""
+        proba, cell_exact, in_range = self.lookup(X)
+        fallback = ~cell_exact if exact else ~in_range
+        return self._fallback(X, proba, fallback, model)
+
+    def risk_bands(self, X, exact=True, model=None):
+        """"low"/"moderate"/"high" per row; with `exact`, rows whose cell band is uncertain use `model`."""
+        flat, in_range = self.cells(X)
+        if not exact:
+            proba = np.asarray(self._flat[flat], dtype=np.float64)
+            return risk_levels(self._fallback(X, proba, ~in_range, model) * 100)
+        band = np.where(in_range, self._band_flat[flat], UNCERTAIN)
+        bands = _BAND_NAMES[np.maximum(band, 0)]
+        fallback = band == UNCERTAIN
+        if fallback.any():
+            bands[fallback] = risk_levels(self._fallback(X, np.zeros(len(band)), fallback, model)[fallback] * 100)
+        return bands
+
+    def _fallback(self, X, proba, mask, model):
+        if mask.any():
+            if model is None:
+                raise ValueError("Some rows need the live model; pass model=")
+            X = np.asarray(X, dtype=np.float64).reshape(len(proba), -1)
+            proba = proba.copy()
+            proba[mask] = model.predict_proba(X[mask])[:, 1]
+        return proba
+
+    # ----------------------------------------------------------------------------
+    # Persistence
+    # ----------------------------------------------------------------------------
+
+    def save(self, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.model_version)
+        # Unique temp names: several API workers may build the same index at once.
+        tmp = f"{base}.{os.getpid()}.tmp"
+        for suffix, array in (("", self.table), (".band", self.band), (".exact", self.exact)):
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(array), allow_pickle=False)
+            os.replace(tmp, f"{base}{suffix}.npy")
+        # The .json goes last: load() only trusts arrays whose metadata says they are complete.
+        meta = dict(self.meta, format=INDEX_FORMAT, edges=[e.tolist() for e in self.edges])
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, f"{base}.json")
+        return base
+
+    @classmethod
+    def load(cls, base):
+        with open(f"{base}.json") as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"index format {meta.get('format')}, expected {INDEX_FORMAT}")
+        arrays = [np.load(f"{base}{suffix}.npy", mmap_mode="r") for suffix in ("", ".band", ".exact")]
+        edges = [np.asarray(e, dtype=np.float64) for e in meta.pop("edges")]
+        return cls(*arrays, edges, meta)
+
+# --------------------------------------------------------------------------------
+# 3. BUILD
+# --------------------------------------------------------------------------------
+
+def _error_samples(n, seed=0):
+    """heart.csv rows inside the form ranges plus `n` uniform draws from the ranges."""
+    from history_store import reference_table
+
+    rng = np.random.default_rng(seed)
+    columns = []
+    for name in FEATURES:
+        lo, hi = FEATURE_RANGES[name]
+        if name in CONTINUOUS_FEATURES:
+            columns.append(np.round(rng.uniform(lo, hi, n), 1))
+        else:
+            columns.append(rng.integers(lo, hi + 1, n).astype(float))
+    X = np.column_stack(columns)
+    if os.path.exists(DATASET_PATH):
+        rows = reference_table(DATASET_PATH).select(FEATURES).to_pandas().to_numpy(dtype=float)
+        X = np.vstack([rows, X])
+    return X
+
+
+def build_risk_index(model_path=MODEL_PATH, max_cells=MAX_CELLS, samples=100_000, chunk=65_536):
+    """Evaluate the compiled model on every cell, bound it over each cell and measure the error."""
+    from fast_model import load_compiled_model
+
+    start = time.perf_counter()
+    model = load_compiled_model(model_path)
+    axes = [_axis(model, column, name) for column, name in enumerate(FEATURES)]
+    full_cells = int(np.prod([len(e) + 1 for e, _ in axes], dtype=float))
+    edges = _coarsen([e for e, _ in axes], [w for _, w in axes], max_cells)
+
+    shape = tuple(len(e) + 1 for e in edges)
+    reps = [_representatives(e, name) for e, name in zip(edges, FEATURES)]
+    bounds = _ensemble_bounds(model, edges)
+    size = int(np.prod(shape))
+    table, band, exact = np.empty(size), np.empty(size, dtype=np.int8), np.empty(size, dtype=bool)
+    for offset in range(0, size, chunk):
+        coords = np.unravel_index(np.arange(offset, min(offset + chunk, size)), shape)
+        X = np.column_stack([r[c] for r, c in zip(reps, coords)])
+        cells = slice(offset, offset + len(X))
+        table[cells] = model.predict_proba(X)[:, 1]
+
+        raw_lo, raw_hi = np.zeros(len(X)), np.zeros(len(X))
+        for used, (lo, hi) in bounds.items():
+            flat = np.ravel_multi_index([coords[f] for f in used], lo.shape) if used else 0
+            raw_lo += lo.reshape(-1)[flat]
+            raw_hi += hi.reshape(-1)[flat]
+        exact[cells] = raw_lo == raw_hi
+        pct_lo, pct_hi = (100 / (1 + np.exp(-(model.init_raw + model.learning_rate * r))) for r in (raw_lo, raw_hi))
+        band_lo = (pct_lo >= LOW_RISK_MAX).astype(np.int8) + (pct_lo >= MODERATE_RISK_MAX)
+        band_hi = (pct_hi >= LOW_RISK_MAX).astype(np.int8) + (pct_hi >= MODERATE_RISK_MAX)
+        band[cells] = np.where(band_lo == band_hi, band_lo, UNCERTAIN)
+    build_seconds = time.perf_counter() - start
+
+    index = RiskIndex(table.reshape(shape), band.reshape(shape), exact.reshape(shape), edges, {
+        "model_version": model_fingerprint(model_path),
+        "model_path": model_path,
+        "shape": list(shape),
+        "cells": size,
+        "full_grid_cells": full_cells,
+        "exact_cells": float(exact.mean()),
+        "band_certain_cells": float((band != UNCERTAIN).mean()),
+        "build_seconds": build_seconds,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    index.meta["error"] = measure_error(index, model_path, samples)
+    return index
+
+
+def measure_error(index, model_path=MODEL_PATH, samples=100_000):
+    """Table vs. the pickled sklearn model over in-range sample inputs."""
+    import warnings
+
+    from heart_model import read_model
+
+    X = _error_samples(samples)
+    X = X[((X >= index._lo) & (X <= index._hi)).all(axis=1)]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        truth = read_model(model_path).predict_proba(X)[:, 1]
+    proba, exact, _ = index.lookup(X)
+    error = np.abs(proba - truth)
+    certain = index.band.reshape(-1)[index.cells(X)[0]] != UNCERTAIN
+    truth_bands = risk_levels(truth * 100)
+    return {
+        "samples": int(len(X)),
+        "max_abs_error": float(error.max()),
+        "p99_abs_error": float(np.percentile(error, 99)),
+        "max_abs_error_exact": float(error[exact].max()) if exact.any() else 0.0,
+        "max_abs_error_inexact": float(error[~exact].max()) if (~exact).any() else 0.0,
+        "exact_fraction": float(exact.mean()),
+        "band_agreement": float((risk_levels(proba * 100) == truth_bands).mean()),
+        "band_certain_fraction": float(certain.mean()),
+        # Must be 1.0: risk_bands only answers from the table for these rows
+        "band_agreement_certain": float((index.risk_bands(X[certain], model=None) == truth_bands[certain]).mean())
+        if certain.any() else 1.0,
+    }
+
+
+def load_risk_index(model_path=MODEL_PATH, directory=INDEX_DIR, build=True, **kwargs):
+    """The index for the current model, building (and saving) it when missing or stale."""
+    base = os.path.join(directory, model_fingerprint(model_path))
+    if os.path.exists(f"{base}.npy") and os.path.exists(f"{base}.json"):
+        try:
+            return RiskIndex.load(base)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Risk Index Error ({base}): {e}")
+    if not build:
+        return None
+    index = build_risk_index(model_path, **kwargs)
+    index.save(directory)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the precomputed risk lookup table.")
+    parser.add_argument("--model", default=MODEL_PATH, help="model artifact (default: %(default)s)")
+    parser.add_argument("--output-dir", default=INDEX_DIR, help="index directory (default: %(default)s)")
+    parser.add_argument("--max-cells", type=int, default=MAX_CELLS, help="table size limit (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=100_000, help="random inputs for the error report")
+    args = parser.parse_args(argv)
+
+    index = build_risk_index(args.model, args.max_cells, args.samples)
+    base = index.save(args.output_dir)
+    print(f"Wrote {base}.npy: {index.meta['cells']:,} cells {tuple(index.meta['shape'])} "
+          f"in {index.meta['build_seconds']:.1f}s")
+    print(json.dumps(index.meta["error"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""What-if sensitivity sweeps for one patient.
+
+For each feature, copies of the patient's feature vector are made with that
+feature stepped across its form range (heart_model.FEATURE_RANGES) and
+scored in one vectorized `predict_proba` call, giving a risk curve per
+feature:
+
+    for name, values, risk_pct in iter_sensitivity(model, row):
+        ...                                   # one batch per feature, for incremental display
+
+    curves = sensitivity(model, row)          # all 13 features in a single call
+"""
+import numpy as np
+
+from heart_model import (
+    CONTINUOUS_FEATURES, CP_MAP, EXANG_MAP, FBS_MAP, FEATURE_RANGES, FEATURES,
+    RESTECG_MAP, SEX_MAP, SLOPE_MAP, THAL_MAP,
+)
+
+DEFAULT_POINTS = 60
+
+# Chart titles and short category labels in the app's wording
+FEATURE_TITLES = {
+    "age": "Age", "sex": "Gender", "cp": "Chest Pain Type", "trtbps": "Resting Blood Pressure",
+    "chol": "Cholesterol", "fbs": "Fasting Blood Sugar > 120", "restecg": "Resting ECG",
+    "thalachh": "Max Heart Rate", "exng": "Exercise Induced Angina", "oldpeak": "Oldpeak (ST Depression)",
+    "slp": "Heart Rate Slope", "caa": "Major Vessels", "thall": "Thallium Stress Result",
+}
+
+_CATEGORY_MAPS = {
+    "sex": SEX_MAP, "cp": CP_MAP, "fbs": FBS_MAP, "restecg": RESTECG_MAP,
+    "exng": EXANG_MAP, "slp": SLOPE_MAP, "thall": THAL_MAP,
+}
+CATEGORY_LABELS = {
+    name: {code: label.split(" (")[0] for label, code in mapping.items()}
+    for name, mapping in _CATEGORY_MAPS.items()
+}
+
+
+def sweep_values(name, points=DEFAULT_POINTS):
+    """Values tried for one feature: every integer if there are few enough, else an even grid."""
+    lo, hi = FEATURE_RANGES[name]
+    if name in CONTINUOUS_FEATURES:
+        return np.linspace(lo, hi, points)
+    if hi - lo + 1 <= points:
+        return np.arange(lo, hi + 1, dtype=float)
+    return np.unique(np.round(np.linspace(lo, hi, points)))
+
+
+def sweep_matrix(row, features=FEATURES, points=DEFAULT_POINTS):
+    """Stacked what-if rows for `features`; returns (X, {name: (values, row slice)})."""
+    row = np.asarray(row, dtype=float)
+    blocks, layout, start = [], {}, 0
+    for name in features:
+        values = sweep_values(name, points)
+        block = np.tile(row, (len(values), 1))
+        block[:, FEATURES.index(name)] = values
+        blocks.append(block)
+        layout[name] = (values, slice(start, start + len(values)))
+        start += len(values)
+    return np.vstack(blocks), layout
+
+
+def sensitivity(model, row, features=FEATURES, points=DEFAULT_POINTS):
+    """{feature: (values, risk %)} for every feature, scored with one predict_proba call."""
+    X, layout = sweep_matrix(row, features, points)
+    risk = model.predict_proba(X)[:, 1] * 100
+    return {name: (values, risk[rows]) for name, (values, rows) in layout.items()}
+
+
+def iter_sensitivity(model, row, features=FEATURES, points=DEFAULT_POINTS):
+    """Yield (feature, values, risk %) one feature at a time, one batched call each."""
+    for name in features:
+        X, layout = sweep_matrix(row, [name], points)
+        yield name, layout[name][0], model.predict_proba(X)[:, 1] * 100
+
+
+def value_labels(name, values):
+    """Display labels for the swept values (category names for coded features)."""
+    labels = CATEGORY_LABELS.get(name)
+    if labels:
+        return [labels.get(int(v), str(int(v))) for v in values]
+    if name in CONTINUOUS_FEATURES:
+        return [round(float(v), 2) for v in values]
+    return [int(v) for v in values]
@@ -0,0 +1,169 @@
+"""Read-only model arrays shared by every serving process.
+
+`export_shared` writes the packed arrays of the compiled ensemble (see
+fast_model.CompiledEnsemble) once, as plain .npy files under
+`.cache/shared_model/<model fingerprint>/`. `attach_shared` maps them back
+read-only with `np.load(mmap_mode="r")`: nothing is unpickled or copied, and
+all processes on the host read the same page-cache pages, so memory per
+worker stays flat however many Streamlit replicas or API workers run.
+
+    python shared_model.py export                  # e.g. at deploy, before starting workers
+    python shared_model.py bench --workers 4       # attach time, memory and throughput per worker
+
+Point HEART_SHARED_MODEL_DIR at a tmpfs such as /dev/shm to keep the arrays in
+shared memory proper; set HEART_SHARED_MODEL=0 to give each process a
+private copy again.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from fast_model import CompiledEnsemble, load_compiled_model
+from heart_model import MODEL_PATH, WARM_UP_ROWS, model_fingerprint
+
+SHARED_DIR = os.environ.get("HEART_SHARED_MODEL_DIR", ".cache/shared_model")
+SHARED_ENABLED = os.environ.get("HEART_SHARED_MODEL", "1") != "0"
+
+_ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "cover")
+
+# --------------------------------------------------------------------------------
+# 1. EXPORT / ATTACH
+# --------------------------------------------------------------------------------
+
+def export_shared(model_path=MODEL_PATH, directory=SHARED_DIR, model=None):
+    """Write the arrays for `model_path` unless they exist already; returns their directory."""
+    target = os.path.join(directory, model_fingerprint(model_path))
+    if os.path.exists(os.path.join(target, "meta.json")):
+        return target
+    model = model or load_compiled_model(model_path)
+
+    # Build under a private name and publish with one rename, so a worker never
+    # sees a half-written directory; if another process won the race, keep theirs.
+    tmp = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for name in _ARRAYS:
+        array = getattr(model, name)
+        if array is not None:
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+    meta = {
+        "init_raw": model.init_raw,
+        "learning_rate": model.learning_rate,
+        "max_depth": model.max_depth,
+        "n_features": model.n_features_in_,
+        "classes": model.classes_.tolist(),
+        "source_version": os.path.basename(target),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def attach_shared(model_path=MODEL_PATH, directory=SHARED_DIR):
+    """CompiledEnsemble over read-only memory maps of the exported arrays (exported on first use)."""
+    target = export_shared(model_path, directory)
+    with open(os.path.join(target, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in _ARRAYS:
+        path = os.path.join(target, f"{name}.npy")
+        # np.asarray drops the np.memmap subclass but keeps the mapping alive as its base.
+        arrays[name] = np.asarray(np.load(path, mmap_mode="r")) if os.path.exists(path) else None
+    model = CompiledEnsemble(
+        **arrays, init_raw=meta["init_raw"], learning_rate=meta["learning_rate"],
+        max_depth=meta["max_depth"], n_features=meta["n_features"], classes=meta["classes"],
+    )
+    model.source_version = meta["source_version"]
+    return model
+
+
+def attach_or_load(model_path=MODEL_PATH, directory=SHARED_DIR):
+    """The shared read-only model when enabled and possible, else a private compiled copy."""
+    if SHARED_ENABLED:
+        try:
+            return attach_shared(model_path, directory)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Shared Model Error ({directory}): {e}")
+    return load_compiled_model(model_path)
+
+# --------------------------------------------------------------------------------
+# 2. BENCHMARK
+# --------------------------------------------------------------------------------
+
+def _private_kb(pid="self"):
+    """Private (unshared) resident memory of a process, in kB."""
+    total = 0
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total += int(line.split()[1])
+    return total
+
+
+def _bench_worker(args):
+    model_path, directory, shared, rows, seconds = args
+    load = (lambda: attach_shared(model_path, directory)) if shared else (lambda: load_compiled_model(model_path))
+    start = time.perf_counter()
+    model = load()
+    attach = time.perf_counter() - start
+    model.predict_proba(rows)
+    # Memory of one more copy, measured once imports and allocator pools are warm
+    before = _private_kb()
+    extra = load()
+    grown = _private_kb() - before
+    del extra
+
+    done, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        model.predict_proba(rows[done % len(rows)])
+        done += 1
+    return attach, grown, done / seconds
+
+
+def bench(model_path=MODEL_PATH, directory=SHARED_DIR, workers=os.cpu_count() or 1, seconds=3.0):
+    """Attach time, private memory per model copy and single-row throughput, shared vs. private."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    export_shared(model_path, directory)
+    rows = np.asarray(WARM_UP_ROWS, dtype=float)
+    results = {}
+    for shared in (True, False):
+        with ProcessPoolExecutor(workers) as pool:
+            runs = list(pool.map(_bench_worker, [(model_path, directory, shared, rows, seconds)] * workers))
+        results["shared" if shared else "private"] = {
+            "attach_ms": 1000 * max(r[0] for r in runs),
+            "private_kb_per_copy": max(r[1] for r in runs),
+            "predictions_per_second": sum(r[2] for r in runs),
+        }
+    return results
+
+# --------------------------------------------------------------------------------
+# 3. CLI
+# --------------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or benchmark the shared read-only model.")
+    parser.add_argument("command", choices=["export", "bench"])
+    parser.add_argument("--model", default=MODEL_PATH, help="model artifact (default: %(default)s)")
+    parser.add_argument("--dir", default=SHARED_DIR, help="shared array directory (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes for bench")
+    parser.add_argument("--seconds", type=float, default=3.0, help="scoring time per worker for bench")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(f"Exported {export_shared(args.model, args.dir)}")
+        return
+    for mode, stats in bench(args.model, args.dir, args.workers, args.seconds).items():
+        print(f"{mode:<8} attach {stats['attach_ms']:7.2f} ms   +{stats['private_kb_per_copy']:6d} kB private per model copy"
+              f"   {stats['predictions_per_second']:9.0f} predictions/s")
+
+
+if __name__ == "__main__":
+    main()
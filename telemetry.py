@@ -0,0 +1,245 @@
+"""Spans, counters and latency histograms for the hot path.
+
+    with telemetry.span("db_push", path="Patients_Analysis"):
+        ...
+
+Every span feeds the `heart_span_duration_seconds{span=...}` histogram and
+the `heart_span_total{span=...,status=...}` counter. Metrics are served in
+Prometheus text format by `start_metrics_server()` (HEART_METRICS_PORT,
+default 9464). When HEART_TRACE_FILE is set, each finished span is also
+appended to that file as one JSON line.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_PORT = int(os.environ.get("HEART_METRICS_PORT", 9464))
+TRACE_FILE = os.environ.get("HEART_TRACE_FILE")
+
+# --------------------------------------------------------------------------------
+# 1. METRIC TYPES
+# --------------------------------------------------------------------------------
+
+class Histogram:
+    """Fixed-bucket histogram; `bounds` are inclusive upper edges."""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.total += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            labels = [str(b) for b in self.bounds] + ["+Inf"]
+            return {
+                "buckets": dict(zip(labels, self.counts)),
+                "count": self.total,
+                "mean": self.sum / self.total if self.total else 0.0,
+            }
+
+    def cumulative(self):
+        with self._lock:
+            running, out = 0, []
+            for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+                running += count
+                out.append((bound, running))
+            return out, self.sum, self.total
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def histogram(self, name, bounds=LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(bounds)
+            return hist
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def gauge(self, name, fn, **labels):
+        """Register a callback read at scrape time (e.g. a queue length)."""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = fn
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda kv: kv[0])
+            gauges = sorted(self._gauges.items(), key=lambda kv: kv[0])
+
+        lines, seen = [], set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), fn in gauges:
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), hist in histograms:
+            header(name, "histogram")
+            buckets, total_sum, count = hist.cumulative()
+            for bound, running in buckets:
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {running}")
+            lines.append(f"{name}_sum{_format_labels(key)} {total_sum}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REGISTRY.describe("heart_span_duration_seconds", "Duration of instrumented operations.")
+REGISTRY.describe("heart_span_total", "Finished instrumented operations by status.")
+
+# --------------------------------------------------------------------------------
+# 2. SPANS / TRACES
+# --------------------------------------------------------------------------------
+
+_current_span = contextvars.ContextVar("heart_current_span", default=None)
+_trace_lock = threading.Lock()
+
+
+def _write_trace(record):
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _trace_lock:
+        with open(TRACE_FILE, "a") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name, **attrs):
+    parent = _current_span.get()
+    span_id = uuid.uuid4().hex[:16]
+    trace_id = parent[0] if parent else uuid.uuid4().hex
+    token = _current_span.set((trace_id, span_id))
+    status = "ok"
+    wall_start = time.time()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        # st.stop()/st.rerun() raise control-flow exceptions; they are not errors.
+        status = "error" if isinstance(e, Exception) else "ok"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        REGISTRY.observe("heart_span_duration_seconds", duration, span=name)
+        REGISTRY.inc("heart_span_total", span=name, status=status)
+        if TRACE_FILE:
+            _write_trace({
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_id": parent[1] if parent else None,
+                "name": name,
+                "start": wall_start,
+                "duration_ms": duration * 1000,
+                "status": status,
+                "attrs": attrs,
+            })
+
+
+def traced(name=None):
+    """Decorator form of `span`."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# --------------------------------------------------------------------------------
+# 3. METRICS ENDPOINT
+# --------------------------------------------------------------------------------
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0", registry=REGISTRY):
+    """Serve GET /metrics from a daemon thread; returns the server (None if the port is taken)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        print(f"Metrics Error: could not listen on {host}:{port} ({e})")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
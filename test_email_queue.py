@@ -0,0 +1,219 @@
+"""EmailOutbox against a local SMTP stand-in (no network, no credentials)."""
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+from email_queue import FAILED, QUEUED, SENT, EmailOutbox
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        if not server.accepting:
+            self.reply("421 stub unavailable")
+            return
+        self.reply("220 stub ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            if not line:
+                return
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif verb == "MAIL":
+                sender, recipients = line.split(":", 1)[1].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = line.split(":", 1)[1].strip(" <>")
+                if address in server.refused:
+                    self.reply("550 no such user")
+                elif address in server.deferred:
+                    self.reply("452 mailbox full, try later")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data.append(chunk)
+                server.messages.append((sender, recipients, b"".join(data)))
+                self.reply("250 queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class _SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.accepting = True
+        self.refused = set()
+        self.deferred = set()
+        self.messages = []
+
+
+@pytest.fixture
+def smtp_stub():
+    server = _SMTPStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_outbox(tmp_path, smtp_stub):
+    outboxes = []
+
+    def make(**kwargs):
+        options = dict(host="127.0.0.1", port=smtp_stub.server_address[1], use_starttls=False,
+                       poll_interval=0.01, backoff=0.05, timeout=5.0)
+        options.update(kwargs)
+        outbox = EmailOutbox(str(tmp_path / "outbox.sqlite3"), **options)
+        outboxes.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in outboxes:
+        outbox.stop()
+
+
+def _message(to, text="Your prediction result"):
+    msg = MIMEText(text)
+    msg["From"] = "Heart Attack App <app@example.com>"
+    msg["To"] = to
+    msg["Subject"] = "Result"
+    return msg
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_delivers_queued_messages(make_outbox, smtp_stub):
+    outbox = make_outbox().start()
+    ids = outbox.enqueue_many([_message("doctor@example.com"), _message("a@example.com, b@example.com")])
+
+    assert outbox.flush(timeout=5)
+    assert _wait_for(lambda: all(outbox.status(i)["status"] == SENT for i in ids))
+    assert outbox.stats() == {QUEUED: 0, SENT: 2, FAILED: 0}
+    assert [m[1] for m in smtp_stub.messages] == [["doctor@example.com"], ["a@example.com", "b@example.com"]]
+    assert b"Your prediction result" in smtp_stub.messages[0][2]
+    assert outbox.status(ids[0])["attempts"] == 1
+
+
+def test_deferred_recipient_is_retried_with_backoff_then_failed(make_outbox, smtp_stub):
+    smtp_stub.deferred.add("nobody@example.com")
+    outbox = make_outbox(max_attempts=3)
+    message_id = outbox.enqueue(_message("nobody@example.com"))
+
+    outbox._send_batch(outbox._due_batch())
+    status = outbox.status(message_id)
+    assert status["status"] == QUEUED and status["attempts"] == 1
+    assert "SMTPRecipientsRefused" in status["error"]
+    assert outbox._due_batch() == []          # backing off: not due again right away
+
+    outbox.start()
+    assert _wait_for(lambda: outbox.status(message_id)["status"] == FAILED)
+    assert outbox.status(message_id)["attempts"] == 3
+    assert smtp_stub.messages == []
+
+
+def test_permanently_refused_recipient_fails_at_once(make_outbox, smtp_stub):
+    smtp_stub.refused.add("nobody@example.com")
+    outbox = make_outbox(max_attempts=3)
+    message_id = outbox.enqueue(_message("nobody@example.com"))
+
+    outbox._send_batch(outbox._due_batch())
+    status = outbox.status(message_id)
+    assert status["status"] == FAILED and status["attempts"] == 1
+    assert "550" in status["error"]
+
+
+def test_connection_failure_backs_off_the_queue_then_delivers(make_outbox, smtp_stub):
+    smtp_stub.accepting = False
+    outbox = make_outbox()
+    message_id = outbox.enqueue(_message("doctor@example.com"))
+
+    for _ in range(5):                       # a long outage never uses up the message's attempts
+        outbox._retry_at = 0.0
+        outbox._send_batch(outbox._due_batch())
+    status = outbox.status(message_id)
+    assert status["status"] == QUEUED and status["attempts"] == 0 and status["error"]
+    assert outbox._connection_failures == 5
+
+    smtp_stub.accepting = True
+    outbox._retry_at = 0.0
+    outbox.start()
+    assert _wait_for(lambda: outbox.status(message_id)["status"] == SENT)
+    assert outbox.status(message_id)["attempts"] == 1
+    assert len(smtp_stub.messages) == 1
+
+
+def test_sent_bodies_are_dropped_and_old_rows_pruned(make_outbox, smtp_stub):
+    outbox = make_outbox().start()
+    sent_id = outbox.enqueue(_message("doctor@example.com"))
+    assert _wait_for(lambda: outbox.status(sent_id)["status"] == SENT)
+    outbox.stop()
+
+    body = outbox._db.execute("SELECT length(message) FROM outbox WHERE id = ?", (sent_id,)).fetchone()[0]
+    assert body == 0
+    queued_id = outbox.enqueue(_message("later@example.com"))
+
+    assert outbox.prune() == 0                 # still within the retention period
+    assert outbox.prune(older_than=-1) == 1    # everything delivered so far
+    assert outbox.status(sent_id) is None
+    assert outbox.status(queued_id)["status"] == QUEUED
+
+
+def test_database_errors_do_not_stop_the_worker(make_outbox, smtp_stub, monkeypatch):
+    import sqlite3
+
+    outbox = make_outbox()
+    due_batch, calls = outbox._due_batch, []
+
+    def flaky_due_batch():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return due_batch()
+
+    monkeypatch.setattr(outbox, "_due_batch", flaky_due_batch)
+    message_id = outbox.enqueue(_message("doctor@example.com"))
+    outbox.start()
+    assert _wait_for(lambda: outbox.status(message_id)["status"] == SENT)
+
+
+def test_enqueue_many_commits_in_chunks(make_outbox, smtp_stub):
+    outbox = make_outbox()
+    ids = outbox.enqueue_many((_message(f"p{i}@example.com") for i in range(7)), chunk=3)
+
+    assert ids == sorted(ids) and len(ids) == 7
+    assert outbox.stats()[QUEUED] == 7
+    assert outbox.enqueue_many(iter([])) == []
@@ -0,0 +1,180 @@
+"""RecordWriter against InMemoryDatabase (and a pyrebase Database with a fake HTTP session)."""
+import json
+import time
+
+import pytest
+
+from firebase_writer import InMemoryDatabase, RecordWriter, generate_push_key, private_ref
+
+
+class FlakyDatabase(InMemoryDatabase):
+    """InMemoryDatabase whose first `failures` updates raise, like a dropped connection."""
+
+    def __init__(self, failures=0):
+        super().__init__()
+        self.failures = failures
+        self.tokens = []
+
+    def child(self, *args):
+        ref = super().child(*args)
+        ref.__class__ = FlakyDatabase
+        return ref
+
+    def update(self, data, token=None):
+        root = self._root
+        root.tokens.append(token)
+        if root.failures:
+            root.failures -= 1
+            raise ConnectionError("network down")
+        return super().update(data, token)
+
+
+class RejectingDatabase(InMemoryDatabase):
+    """InMemoryDatabase whose security rules refuse writes under one path."""
+
+    def child(self, *args):
+        ref = super().child(*args)
+        ref.__class__ = RejectingDatabase
+        return ref
+
+    def update(self, data, token=None):
+        if self._path[:1] == ["Locked"]:
+            import requests
+
+            response = requests.Response()
+            response.status_code = 401
+            raise requests.HTTPError("401 Client Error: Permission denied", response=response)
+        return super().update(data, token)
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.sqlite3")
+
+
+def test_push_keys_are_ordered_like_firebase_push_ids():
+    keys = [generate_push_key() for _ in range(1000)]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == 1000
+    assert all(len(k) == 20 for k in keys)
+
+
+def test_flush_writes_queued_records_in_batches(queue_path):
+    db = InMemoryDatabase()
+    writer = RecordWriter(db, "Patients_Analysis", queue_path=queue_path, max_batch=10)
+    keys = writer.push_many([{"Patient_Name": f"p{i}", "Risk_Score": i} for i in range(25)])
+    assert writer.pending() == 25
+    assert db.data == {}
+
+    assert writer.flush() == 25
+    assert writer.pending() == 0
+    assert db.calls == 3                      # 10 + 10 + 5, one multi-path update each
+    stored = db.data["Patients_Analysis"]
+    assert sorted(stored) == keys
+    assert stored[keys[7]] == {"Patient_Name": "p7", "Risk_Score": 7}
+
+
+def test_failed_flush_keeps_records_and_backs_off(queue_path):
+    db = FlakyDatabase(failures=2)
+    writer = RecordWriter(db, "Patients_Analysis", queue_path=queue_path, flush_interval=0.01,
+                          backoff=0.05, token=lambda owner: f"token-{owner}").start()
+    try:
+        key = writer.push({"Patient_Name": "Jane"}, owner="sid-1")
+        writer._wakeup.set()
+        deadline = time.monotonic() + 5
+        while writer.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        writer.stop()
+    assert writer.pending() == 0
+    assert db.data["Patients_Analysis"][key] == {"Patient_Name": "Jane"}
+    assert db.tokens[:3] == ["token-sid-1"] * 3   # two failures, then the successful retry
+    assert writer.last_error is None
+
+
+def test_each_record_is_written_with_its_owners_token(queue_path):
+    db = FlakyDatabase()
+    live = {"sid-a": "token-a", "sid-b": "token-b"}
+    writer = RecordWriter(db, "Patients_Analysis", queue_path=queue_path, token=live.get)
+    a = writer.push({"Doctor_Email": "a@example.com"}, owner="sid-a")
+    b = writer.push_many([{"Doctor_Email": "b@example.com"}] * 2, owner="sid-b")
+    gone = writer.push({"Doctor_Email": "c@example.com"}, owner="sid-ended")
+    anonymous = writer.push({"Doctor_Email": None})
+
+    assert writer.flush() == 5
+    assert sorted(db.tokens, key=str) == [None, None, "token-a", "token-b"]
+    assert sorted(db.data["Patients_Analysis"]) == sorted([a, *b, gone, anonymous])
+
+
+def test_queued_records_survive_a_restart(queue_path):
+    writer = RecordWriter(FlakyDatabase(failures=1), "Patients_Analysis", queue_path=queue_path)
+    key = writer.push({"Patient_Name": "Jane"})
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    writer._queue.close()
+
+    db = InMemoryDatabase()
+    restarted = RecordWriter(db, "Patients_Analysis", queue_path=queue_path)
+    assert restarted.pending() == 1
+    assert restarted.flush() == 1
+    assert db.data["Patients_Analysis"] == {key: {"Patient_Name": "Jane"}}
+
+
+def test_flush_does_not_touch_the_shared_pyrebase_path(queue_path):
+    from pyrebase.pyrebase import Database
+
+    class FakeResponse:
+        status_code = 200
+        text = "{}"
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {}
+
+    class FakeSession:
+        def __init__(self):
+            self.patches = []
+
+        def patch(self, url, headers=None, data=None):
+            self.patches.append((url, json.loads(data)))
+            return FakeResponse()
+
+    session = FakeSession()
+    db = Database(None, "api-key", "https://example.firebaseio.com", session)
+    writer = RecordWriter(db, "Patients_Analysis", queue_path=queue_path)
+    key = writer.push({"Patient_Name": "Jane"})
+
+    db.child("Other").child("path")           # another thread half-way through building a query
+    writer.flush()
+    assert db.path == "Other/path"
+    assert session.patches == [("https://example.firebaseio.com/Patients_Analysis.json",
+                                {key: {"Patient_Name": "Jane"}})]
+
+
+def test_private_ref_shares_in_memory_data():
+    db = InMemoryDatabase()
+    private_ref(db).child("a").update({"k": 1})
+    assert db.data == {"a": {"k": 1}}
+    assert db.calls == 1
+
+
+def test_rejected_records_do_not_block_the_queue(queue_path):
+    db = RejectingDatabase()
+    locked = RecordWriter(db, "Locked", queue_path=queue_path)
+    writer = RecordWriter(db, "Patients_Analysis", queue_path=queue_path, max_batch=2, backoff=0.0, max_attempts=3)
+    rejected = locked.push_many([{"Patient_Name": "Ann"}, {"Patient_Name": "Bob"}])
+    keys = writer.push_many([{"Patient_Name": f"p{i}"} for i in range(3)])
+
+    assert writer.flush() == 3                 # the oldest rows are rejected; later ones still go out
+    assert sorted(db.data["Patients_Analysis"]) == keys
+    assert "Permission denied" in str(writer.last_error)
+    assert writer.pending() == 2 and writer.dead_letters() == 0
+
+    writer.flush()
+    writer.flush()                             # third rejection: out of attempts
+    assert writer.pending() == 0 and writer.dead_letters() == 2
+    dead = writer._queue.execute("SELECT key, attempts, last_error FROM dead_letter ORDER BY key").fetchall()
+    assert [row[0] for row in dead] == rejected
+    assert all(row[1] == 3 and "401" in row[2] for row in dead)
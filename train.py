@@ -0,0 +1,263 @@
+"""Reproducible training for the heart attack model.
+
+Replaces the manual notebook run: every model family from
+HeartAttackPredictionCode.ipynb is tuned with a parallel GridSearchCV over
+the same pre-computed CV folds, and the best gradient boosting model (the
+family the app and the compiled inference engine serve) is written as a
+versioned artifact with a metrics/timings manifest.
+
+    python train.py                              # all families, all cores
+    python train.py --families gradient_boosting --install
+    python train.py --scoring f1 --n-jobs 4
+
+Search results and fitted scalers are cached under .cache/train, so a rerun
+with unchanged data and grids takes seconds.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import platform
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from heart_model import DATASET_PATH, FEATURES, MODEL_PATH, TARGET
+
+MODELS_DIR = "Model_datasets/models"
+CACHE_DIR = ".cache/train"
+RANDOM_STATE = 42
+
+# Family name -> (estimator factory, parameter grid, needs feature scaling)
+def _families():
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
+    return {
+        "decision_tree": (
+            lambda: DecisionTreeClassifier(random_state=RANDOM_STATE),
+            {"max_depth": [1, 2, 3, 4, 5]}, False,
+        ),
+        "random_forest": (
+            lambda: RandomForestClassifier(random_state=RANDOM_STATE),
+            {"n_estimators": [50, 100, 150], "max_depth": [1, 2, 3, 4, 5]}, False,
+        ),
+        "svm": (
+            lambda: SVC(probability=True, random_state=RANDOM_STATE),
+            {"C": [0.1, 1, 10], "kernel": ["linear", "rbf", "poly"]}, True,
+        ),
+        "logistic_regression": (
+            lambda: LogisticRegression(max_iter=1000),
+            {"C": [0.1, 1, 10]}, True,
+        ),
+        "gradient_boosting": (
+            # Early stopping: up to 500 stages, stop after 10 without improvement
+            lambda: GradientBoostingClassifier(
+                n_estimators=500, n_iter_no_change=10, validation_fraction=0.1,
+                random_state=RANDOM_STATE,
+            ),
+            {"max_depth": [1, 2, 3, 4, 5], "learning_rate": [0.05, 0.1, 0.2]}, False,
+        ),
+        "knn": (
+            lambda: KNeighborsClassifier(),
+            {"n_neighbors": [3, 5, 7, 9]}, True,
+        ),
+        "naive_bayes": (
+            lambda: GaussianNB(),
+            {"var_smoothing": [1e-9, 1e-8, 1e-7]}, False,
+        ),
+    }
+
+# --------------------------------------------------------------------------------
+# 1. DATA
+# --------------------------------------------------------------------------------
+
+def load_dataset(path=DATASET_PATH):
+    from history_store import reference_table
+
+    # Memory-mapped Arrow copy of the CSV (converted on first use)
+    frame = reference_table(path).to_pandas()
+    return frame[FEATURES], frame[TARGET]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# --------------------------------------------------------------------------------
+# 2. SEARCH
+# --------------------------------------------------------------------------------
+
+def _search(family, X_train, y_train, folds, scoring, n_jobs, memory_dir):
+    from joblib import Memory
+    from sklearn.model_selection import GridSearchCV
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import MinMaxScaler
+
+    factory, grid, scaled = _families()[family]
+    if scaled:
+        # Pipeline memory caches the scaler fitted on each fold across grid points
+        estimator = Pipeline(
+            [("scale", MinMaxScaler()), ("model", factory())],
+            memory=Memory(os.path.join(memory_dir, "transformers"), verbose=0),
+        )
+        grid = {f"model__{k}": v for k, v in grid.items()}
+    else:
+        estimator = factory()
+
+    start = time.perf_counter()
+    search = GridSearchCV(estimator, grid, scoring=scoring, cv=folds, n_jobs=n_jobs, refit=True)
+    search.fit(X_train, y_train)
+    return {
+        "best_estimator": search.best_estimator_,
+        "best_params": {k.replace("model__", ""): v for k, v in search.best_params_.items()},
+        "cv_score": float(search.best_score_),
+        "candidates": len(search.cv_results_["params"]),
+        "search_seconds": time.perf_counter() - start,
+    }
+
+
+def _metrics(model, X_test, y_test):
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+
+    y_pred = model.predict(X_test)
+    proba = model.predict_proba(X_test)[:, 1]
+    return {
+        "accuracy": accuracy_score(y_test, y_pred),
+        "f1": f1_score(y_test, y_pred),
+        "precision": precision_score(y_test, y_pred),
+        "recall": recall_score(y_test, y_pred),
+        "roc_auc": roc_auc_score(y_test, proba),
+    }
+
+
+def train(families=None, scoring="accuracy", n_jobs=-1, cv=5, dataset_path=DATASET_PATH,
+          cache_dir=CACHE_DIR, use_cache=True):
+    """Tune every family; returns (best gradient boosting model, manifest dict)."""
+    from joblib import Memory
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+
+    timings = {}
+    start = time.perf_counter()
+    X, y = load_dataset(dataset_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=RANDOM_STATE, stratify=y,
+    )
+    # Folds are computed once and shared by every search.
+    folds = list(StratifiedKFold(cv, shuffle=True, random_state=RANDOM_STATE).split(X_train, y_train))
+    timings["data"] = time.perf_counter() - start
+
+    families = families or list(_families())
+    if "gradient_boosting" not in families:
+        families = families + ["gradient_boosting"]
+
+    search = _search
+    if use_cache:
+        # Whole search results are cached on (family, data, folds, scoring); n_jobs doesn't matter.
+        search = Memory(os.path.join(cache_dir, "searches"), verbose=0).cache(_search, ignore=["n_jobs", "memory_dir"])
+
+    results = {}
+    for family in families:
+        family_start = time.perf_counter()
+        result = search(family, X_train, y_train, folds, scoring, n_jobs, cache_dir)
+        result["metrics"] = _metrics(result["best_estimator"], X_test, y_test)
+        results[family] = result
+        timings[family] = time.perf_counter() - family_start
+        print(f"{family:<22} cv {scoring}={result['cv_score']:.4f}  test acc={result['metrics']['accuracy']:.4f}"
+              f"  ({timings[family]:.1f}s)")
+
+    best = results["gradient_boosting"]["best_estimator"]
+    timings["total"] = time.perf_counter() - start
+
+    manifest = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "model_family": "gradient_boosting",
+        "params": results["gradient_boosting"]["best_params"],
+        "n_estimators": int(getattr(best, "n_estimators_", best.n_estimators)),
+        "features": FEATURES,
+        "scoring": scoring,
+        "cv_folds": cv,
+        "metrics": results["gradient_boosting"]["metrics"],
+        "families": {
+            name: {
+                "best_params": r["best_params"],
+                "cv_score": r["cv_score"],
+                "candidates": r["candidates"],
+                "search_seconds": r["search_seconds"],
+                "metrics": r["metrics"],
+            }
+            for name, r in results.items()
+        },
+        "timings": timings,
+        "dataset": {"path": dataset_path, "sha256": file_sha256(dataset_path), "rows": int(len(X))},
+        "environment": {
+            "python": platform.python_version(),
+            "sklearn": __import__("sklearn").__version__,
+            "numpy": np.__version__,
+            "n_jobs": n_jobs,
+        },
+    }
+    return best, manifest
+
+# --------------------------------------------------------------------------------
+# 3. ARTIFACTS
+# --------------------------------------------------------------------------------
+
+def write_artifact(model, manifest, models_dir=MODELS_DIR):
+    """Write model.pickle + manifest.json under models_dir/<version>/; returns that dir."""
+    payload = pickle.dumps(model)
+    checksum = hashlib.sha256(payload).hexdigest()
+    version = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S") + "-" + checksum[:8]
+    target = os.path.join(models_dir, version)
+    os.makedirs(target, exist_ok=True)
+
+    with open(os.path.join(target, "model.pickle"), "wb") as f:
+        f.write(payload)
+    manifest = dict(manifest, version=version, sha256=checksum)
+    with open(os.path.join(target, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return target
+
+
+def install_artifact(target, path=MODEL_PATH):
+    """Replace `path` with target's model.pickle in one rename, so readers never see a partial pickle."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(os.path.join(target, "model.pickle"), tmp)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the heart attack model.")
+    parser.add_argument("--families", nargs="+", choices=sorted(_families()), help="model families to tune")
+    parser.add_argument("--scoring", default="accuracy", help="GridSearchCV scoring (default: %(default)s)")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="parallel jobs, -1 = all cores")
+    parser.add_argument("--cv", type=int, default=5, help="number of CV folds")
+    parser.add_argument("--output-dir", default=MODELS_DIR, help="artifact directory (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore cached search results")
+    parser.add_argument("--install", action="store_true", help=f"also copy the model to {MODEL_PATH}")
+    args = parser.parse_args(argv)
+
+    model, manifest = train(
+        families=args.families, scoring=args.scoring, n_jobs=args.n_jobs, cv=args.cv,
+        use_cache=not args.no_cache,
+    )
+    target = write_artifact(model, manifest, args.output_dir)
+    print(f"Wrote {target} in {manifest['timings']['total']:.1f}s")
+
+    if args.install:
+        install_artifact(target)
+        print(f"Installed as {MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Cold-start helpers: warm-up hook and import-time report.
+
+    python warmup.py                   # build the model snapshot + asset cache (e.g. at image build)
+    python warmup.py --import-report   # measure the import cost of the heavy modules
+    python warmup.py --import-report --json
+
+Login.py calls `start_background_warm_up()` once per server process, so the
+first logged-in user finds the heavy modules imported, the served model's
+shared arrays exported and the animations cached. The thread only touches
+plain modules: Streamlit's cached resources are created by the first script
+run, which then attaches to the warm arrays instead of compiling the model.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import assets
+from heart_model import MODEL_PATH, WARM_UP_ROWS
+
+HEAVY_MODULES = [
+    "numpy", "pandas", "requests", "pyrebase", "sklearn.ensemble",
+    "streamlit", "streamlit_option_menu", "streamlit_lottie",
+    "fast_model", "app",
+]
+
+# What app.py imports: the two widget packages at the top, the rest lazily on first use
+APP_MODULES = ["pandas", "streamlit_option_menu", "streamlit_lottie", "explain", "sensitivity",
+               "cohort_stats", "drift_monitor"]
+
+
+def warm_up(model_path=MODEL_PATH):
+    """Load the compiled model and animations; returns step timings in seconds."""
+    from fast_model import load_compiled_model
+
+    timings = {}
+    start = time.perf_counter()
+    model = load_compiled_model(model_path)
+    timings["model"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.predict_proba(WARM_UP_ROWS)
+    timings["predict"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assets.prefetch()
+    for url in assets.LOTTIE_URLS:
+        assets.load_lottie(url)
+    timings["assets"] = time.perf_counter() - start
+    return timings
+
+
+def _warm_up_in_background():
+    try:
+        start = time.perf_counter()
+        import importlib
+
+        from explain import PathExplainer
+        from model_registry import LIVE_POINTER, load_version, read_pointer
+
+        for module in APP_MODULES:
+            importlib.import_module(module)
+        # Exports the shared arrays of the version the app will serve (see shared_model.py)
+        loaded = load_version(read_pointer(LIVE_POINTER))
+        PathExplainer(loaded.model).contributions(WARM_UP_ROWS)
+        assets.prefetch()
+        for url in assets.LOTTIE_URLS:
+            assets.load_lottie(url)
+        print(f"Warm-up done in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"Warm-up Error: {e}")
+
+
+def start_background_warm_up():
+    thread = threading.Thread(target=_warm_up_in_background, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def measure_import(module):
+    """Seconds to import `module` in a fresh interpreter (nothing cached in sys.modules)."""
+    code = (
+        "import time, warnings; warnings.simplefilter('ignore'); t = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - t)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def import_report(modules=HEAVY_MODULES):
+    return {module: measure_import(module) for module in modules}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm caches or report import times.")
+    parser.add_argument("--import-report", action="store_true", help="measure import time of heavy modules")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args(argv)
+
+    if args.import_report:
+        report = import_report()
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            for module, seconds in sorted(report.items(), key=lambda kv: -(kv[1] or 0)):
+                shown = "not installed" if seconds is None else f"{seconds * 1000:8.1f} ms"
+                print(f"{module:<24}{shown}")
+        return
+
+    timings = warm_up()
+    if args.json:
+        print(json.dumps(timings, indent=2))
+    else:
+        for step, seconds in timings.items():
+            print(f"{step:<10}{seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()